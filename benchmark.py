@@ -0,0 +1,275 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+import telegram
+import fetch_epic_images
+import fetch_nasa_images
+import fetch_spacex_images
+import tg_bot
+from download_utils import download_images, DEFAULT_PER_HOST
+from file_utils import format_size
+from http_client import get_session, RETRY_STATUSES
+from mock_api_server import start_server, DEFAULT_PAYLOAD_SIZE
+from publication_tg_bot import publish_batch
+from publish_queue import PublishQueue, SUPPORTED_EXTENSIONS
+
+SCENARIOS = ('download', 'apod', 'epic', 'spacex', 'publish')
+BENCH_TOKEN = '123456:benchmark'
+EPIC_IMAGES_PER_DAY = 10
+SPACEX_IMAGES_PER_LAUNCH = 5
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга (None для пустого списка)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss():
+    """Пиковый объём памяти процесса в байтах"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS — байты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def count_images(folder):
+    """Считает скачанные картинки в папке и их общий объём"""
+    count = size = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not name.startswith('.') and Path(name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                count += 1
+                size += os.path.getsize(os.path.join(root, name))
+    return count, size
+
+
+class RequestRecorder:
+    """Записывает время ответа каждого запроса общей сессии requests.
+
+    Время берётся из response.elapsed — от отправки запроса до получения
+    заголовков ответа. Ответы 429/5xx считаются отдельно как повторы.
+    """
+
+    def __init__(self, session=None):
+        self.session = session or get_session()
+        self.latencies = []
+        self.retries = 0
+
+    def __enter__(self):
+        self.session.hooks['response'].append(self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.session.hooks['response'].remove(self.record)
+
+    def record(self, response, *args, **kwargs):
+        self.latencies.append(response.elapsed.total_seconds())
+        if response.status_code in RETRY_STATUSES:
+            self.retries += 1
+
+
+def point_to_mock(base_url):
+    """Перенаправляет адреса API в модулях на сервер-заглушку"""
+    fetch_nasa_images.APOD_URL = f'{base_url}/planetary/apod'
+    fetch_epic_images.EPIC_API_URL = f'{base_url}/EPIC/api'
+    fetch_epic_images.EPIC_ARCHIVE_URL = f'{base_url}/archive'
+    fetch_spacex_images.SPACEX_API_URL = f'{base_url}/v5/launches'
+    tg_bot.TELEGRAM_API_URL = f'{base_url}/bot'
+
+
+def run_download(base_url, folder, images, workers, per_host):
+    urls = [f'{base_url}/images/bench/{index}.jpg' for index in range(images)]
+    download_images(urls, folder, 'bench', workers=workers, per_host=per_host)
+
+
+def run_apod(base_url, folder, images, workers, per_host):
+    start = date(2020, 1, 1)
+    fetch_nasa_images.fetch_nasa_photos(
+        'DEMO_KEY', folder, 'nasa', workers=workers, per_host=per_host,
+        start_date=start, end_date=start + timedelta(days=images - 1)
+    )
+
+
+def run_epic(base_url, folder, images, workers, per_host):
+    start = date(2020, 1, 1)
+    days = max(1, images // EPIC_IMAGES_PER_DAY)
+    fetch_epic_images.fetch_epic_photos(
+        'DEMO_KEY', folder, 'epic', workers=workers, per_host=per_host,
+        start_date=start, end_date=start + timedelta(days=days - 1)
+    )
+
+
+def run_spacex(base_url, folder, images, workers, per_host):
+    fetch_spacex_images.fetch_spacex_launches(folder, 'spacex', start_date=date(2020, 1, 1), workers=workers, per_host=per_host)
+
+
+def run_publish(folder, images, latencies):
+    """Публикует images фото в Telegram-заглушку, замеряя каждую отправку
+
+    Returns:
+        int: Количество повторов после ошибок и ответов 429
+    """
+    retries = 0
+    with PublishQueue(folder) as queue:
+        published = 0
+        while published < images:
+            started = time.perf_counter()
+            retry_after = 0
+            try:
+                publish_batch(queue, BENCH_TOKEN, '-1001')
+            except telegram.error.RetryAfter as e:
+                retries += 1
+                retry_after = e.retry_after
+            except telegram.error.NetworkError:
+                retries += 1
+            else:
+                published += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+            if retry_after:
+                time.sleep(retry_after)
+    return retries
+
+
+def run_scenario(name, base_url, images, workers, per_host):
+    """Выполняет один сценарий и возвращает его показатели.
+
+    Returns:
+        dict: Показатели сценария (картинок, секунд, картинок/с, МБ/с,
+            p50 и p99 времени запроса в мс, повторов, пик памяти)
+    """
+    with tempfile.TemporaryDirectory() as folder, RequestRecorder() as recorder:
+        if name == 'publish':
+            run_download(base_url, folder, images, workers, per_host)
+            publish_latencies = []
+            started = time.perf_counter()
+            retries = run_publish(folder, images, publish_latencies)
+            elapsed = time.perf_counter() - started
+            count, size = images, count_images(folder)[1]
+            latencies = publish_latencies
+        else:
+            started = time.perf_counter()
+            runners = {'download': run_download, 'apod': run_apod, 'epic': run_epic, 'spacex': run_spacex}
+            runners[name](base_url, folder, images, workers, per_host)
+            elapsed = time.perf_counter() - started
+            count, size = count_images(folder)
+            latencies, retries = recorder.latencies, recorder.retries
+
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    return {
+        'scenario': name,
+        'images': count,
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'images_per_sec': round(count / elapsed, 2),
+        'mb_per_sec': round(size / elapsed / 1024 / 1024, 2),
+        'requests': len(latencies),
+        'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+        'p99_ms': round(p99 * 1000, 1) if p99 is not None else None,
+        'retries': retries,
+        'peak_rss': peak_rss(),
+    }
+
+
+def scenario_process(connection, name, base_url, images, workers, per_host):
+    point_to_mock(base_url)
+    connection.send(run_scenario(name, base_url, images, workers, per_host))
+    connection.close()
+
+
+def run_isolated(name, base_url, images, workers, per_host):
+    """Выполняет сценарий в отдельном чистом процессе.
+
+    Пиковый объём памяти процесса только растёт, поэтому в общем процессе
+    каждый следующий сценарий унаследовал бы пик предыдущих. В отдельном
+    процессе пик памяти относится только к этому сценарию.
+
+    Returns:
+        dict: Показатели сценария (см. run_scenario)
+    """
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=scenario_process, args=(child, name, base_url, images, workers, per_host))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        raise RuntimeError(f'Сценарий {name} завершился с ошибкой (код {process.exitcode})') from None
+    finally:
+        process.join()
+    return result
+
+
+def print_report(results):
+    """Печатает таблицу с результатами замеров"""
+    print(f"\n{'Сценарий':<10}{'фото':>7}{'с':>9}{'фото/с':>9}{'МБ/с':>9}{'p50, мс':>10}{'p99, мс':>10}{'повторов':>10}{'память':>11}")
+    for result in results:
+        p50 = '—' if result['p50_ms'] is None else result['p50_ms']
+        p99 = '—' if result['p99_ms'] is None else result['p99_ms']
+        print(
+            f"{result['scenario']:<10}{result['images']:>7}{result['seconds']:>9}{result['images_per_sec']:>9}"
+            f"{result['mb_per_sec']:>9}{p50:>10}{p99:>10}{result['retries']:>10}{format_size(result['peak_rss']):>11}"
+        )
+
+
+def parse_arguments():
+    """Парсит аргументы командной строки.
+
+    Returns:
+        Namespace: Объект с аргументами командной строки
+    """
+    parser = argparse.ArgumentParser(description='Замер скорости загрузки и публикации на локальной заглушке API')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS), help='Сценарии (по умолчанию: все)')
+    parser.add_argument('--images', type=int, default=100, metavar='', help='Количество картинок в сценарии (по умолчанию: 100)')
+    parser.add_argument('--payload_kb', type=int, default=DEFAULT_PAYLOAD_SIZE // 1024, metavar='', help='Размер картинки в КБ (по умолчанию: 256)')
+    parser.add_argument('--latency_ms', type=float, default=0, metavar='', help='Задержка каждого ответа сервера в мс')
+    parser.add_argument('--error_rate', type=float, default=0, metavar='', help='Доля ответов 500 (от 0 до 1)')
+    parser.add_argument('--rate_limit_rate', type=float, default=0, metavar='', help='Доля ответов 429 (от 0 до 1)')
+    parser.add_argument('-w', '--workers', type=int, default=8, metavar='', help='Количество параллельных загрузок (по умолчанию: 8)')
+    parser.add_argument('--per_host', type=int, default=DEFAULT_PER_HOST, metavar='', help=f'Максимум соединений к одному хосту (по умолчанию: {DEFAULT_PER_HOST})')
+    parser.add_argument('--json', type=Path, metavar='', help='Сохранить результаты в JSON-файл для сравнения между версиями')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    server, base_url = start_server(
+        payload_size=args.payload_kb * 1024,
+        latency=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        images_per_day=EPIC_IMAGES_PER_DAY,
+        launches=max(1, args.images // SPACEX_IMAGES_PER_LAUNCH),
+        images_per_launch=SPACEX_IMAGES_PER_LAUNCH
+    )
+    point_to_mock(base_url)
+    print(f'Сервер-заглушка: {base_url}')
+
+    results = []
+    try:
+        for name in args.scenarios:
+            print(f'\n=== {name} ===')
+            results.append(run_isolated(name, base_url, args.images, args.workers, args.per_host))
+    finally:
+        server.terminate()
+
+    print_report(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'Результаты сохранены в {args.json}')
+
+
+if __name__ == '__main__':
+    main()
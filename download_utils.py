@@ -1,25 +1,360 @@
-import requests
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import chain
 from pathlib import Path
-from file_utils import get_file_extension
+from urllib.parse import urlsplit
+import requests
+from file_utils import get_file_extension, format_size
+from metrics import inc, observe, set_gauge
+from http_client import backoff_delay, get_session, request, MAX_RETRIES
+
+DEFAULT_WORKERS = 1
+DEFAULT_PER_HOST = 4
+CHUNK_SIZE = 64 * 1024
+
+
+class HostLimiter:
+    """Ограничивает число одновременных загрузок с одного хоста и в сумме
+
+    Один ограничитель можно разделить между несколькими пулами загрузок,
+    тогда лимиты действуют на все пулы вместе.
+    """
+
+    def __init__(self, per_host=DEFAULT_PER_HOST, total=None):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._total = threading.BoundedSemaphore(total) if total else None
+
+    @contextmanager
+    def slot(self, url):
+        """Занимает место для загрузки с хоста из URL на время блока with"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            host_semaphore = self._semaphores[host]
+        with host_semaphore, self._total or nullcontext():
+            yield
+
 
+def get_part_path(filepath, url):
+    """Путь к файлу недокачанных данных: рядом с итоговым, своё имя для каждого URL"""
+    filepath = Path(filepath)
+    url_hash = hashlib.sha1(url.encode()).hexdigest()[:12]
+    return filepath.with_name(f'.{filepath.name}.{url_hash}.part')
 
-def download_images(image_urls, folder, filename_prefix):
-    """Скачивает изображение по URL и сохраняет в указанную папку
+
+def parse_content_range(value):
+    """Разбирает заголовок 'Content-Range: bytes 100-199/1000' в (начало, полный размер)"""
+    match = re.fullmatch(r'bytes (\d+)-\d+/(\d+|\*)', value or '')
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return int(start), None if total == '*' else int(total)
+
+
+def stream_to_part(response, part_path, offset=0, chunk_size=CHUNK_SIZE):
+    """Дописывает тело ответа в .part-файл кусками фиксированного размера
+
+    Память на загрузку не зависит от размера файла, а хэш содержимого
+    считается на лету (при докачке — с учётом уже скачанной части).
 
     Args:
-        image_urls: Ссылка на изображение
-        folder: Папка для сохранения (объект Path или строка)
+        response: Ответ requests, полученный с stream=True
+        part_path: Путь к .part-файлу
+        offset: Сколько байт уже лежит в .part-файле (0 — писать заново)
+        chunk_size: Размер куска в байтах
+
+    Returns:
+        tuple: (размер файла, сколько байт получено сейчас, sha256 содержимого)
+    """
+    digest = hashlib.sha256()
+    if offset:
+        with open(part_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                digest.update(chunk)
+
+    received = 0
+    with open(part_path, 'ab' if offset else 'wb') as file:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            file.write(chunk)
+            digest.update(chunk)
+            received += len(chunk)
+    return offset + received, received, digest.hexdigest()
+
+
+def fetch_to_part(session, url, part_path, headers=None):
+    """Скачивает URL в .part-файл, докачивая уже полученную часть
+
+    Рядом с .part-файлом хранится .json с ETag, Last-Modified и полным
+    размером файла. Если .part-файл уже есть, запрашивается только
+    недостающий хвост (Range) с проверкой If-Range: если файл на сервере
+    изменился, сервер вернёт его целиком и загрузка начнётся заново.
+
+    Args:
+        session: Сессия requests
+        url: Ссылка на файл
+        part_path: Путь к .part-файлу
+        headers: Условные заголовки кэша. С ними докачка не используется.
+
+    Returns:
+        tuple: (заголовки ответа, размер файла, получено байт, sha256)
+            или None, если сервер ответил 304 на условный запрос
+
+    Raises:
+        requests.exceptions.ChunkedEncodingError: Если соединение оборвалось
+            раньше, чем пришёл весь файл (.part-файл при этом сохраняется)
+        requests.exceptions.RequestException: Если сервер недоступен и
+            после повторов http_client.request
+    """
+    meta_path = part_path.with_name(f'{part_path.name}.json')
+    validator = None
+    offset = 0
+    if part_path.exists() and meta_path.exists() and not headers:
+        meta = json.loads(meta_path.read_text())
+        validator = meta.get('etag') or meta.get('last_modified')
+        offset = part_path.stat().st_size if validator else 0
+
+    request_headers = {'Accept-Encoding': 'identity', **(headers or {})}
+    if offset:
+        request_headers['Range'] = f'bytes={offset}-'
+        request_headers['If-Range'] = validator
+
+    with request('GET', url, session=session, headers=request_headers, stream=True) as response:
+        if response.status_code == 304 and headers:
+            return None
+        if response.status_code == 416:
+            part_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+            raise requests.exceptions.ChunkedEncodingError(f'Сервер отклонил докачку {url}, начинаю заново')
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            start, total = parse_content_range(response.headers.get('Content-Range'))
+            if start != offset:
+                part_path.unlink(missing_ok=True)
+                raise requests.exceptions.ChunkedEncodingError(f'Сервер прислал не тот диапазон {url}, начинаю заново')
+        else:
+            offset = 0
+            length = response.headers.get('Content-Length')
+            total = int(length) if length and length.isdigit() else None
+
+        meta_path.write_text(json.dumps({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'length': total
+        }))
+        try:
+            size, received, sha256 = stream_to_part(response, part_path, offset)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise requests.exceptions.ChunkedEncodingError(f'Соединение оборвалось во время загрузки {url}: {e}') from e
+
+    if total is not None and size != total:
+        raise requests.exceptions.ChunkedEncodingError(f'Получено {size} из {total} байт {url}')
+    meta_path.unlink(missing_ok=True)
+    return response.headers, size, received, sha256
+
+
+def download_image(session, url, filepath, limiter=None, store=None, cache=None, metadata=None):
+    """Скачивает одно изображение по URL и сохраняет в файл
+
+    Данные пишутся в .part-файл рядом с итоговым и после проверки размера
+    атомарно переименовываются. При обрыве соединения .part-файл остаётся,
+    и следующая попытка (в этом же запуске или в следующем) докачивает
+    только недостающие байты. Ошибки до начала ответа (сервер недоступен,
+    429/5xx) повторяет http_client.request, здесь повторяются только
+    обрывы во время чтения тела.
+
+    Args:
+        session: Сессия requests
+        url: Ссылка на изображение
+        filepath: Путь к файлу для сохранения
+        limiter: Ограничитель соединений на хост (HostLimiter или None)
+        store: Хранилище ImageStore. Если задано, уже скачанные URL
+            пропускаются, к имени файла добавляется хэш содержимого,
+            а одинаковые файлы сохраняются один раз.
+        cache: Кэш HttpCache. Если в filepath уже лежит картинка с этого
+            URL, запрос делается условным, и ответ 304 не перезаписывает файл.
+        metadata: Метаданные снимка для индекса хранилища (source, title, captured_at)
+
+    Returns:
+        tuple: (статус 'downloaded' / 'duplicate' / 'skipped', размер в байтах)
+    """
+    filepath = Path(filepath)
+    if store and store.has_url(url):
+        return 'skipped', 0
+
+    headers = cache.validators(url, filepath) if cache else {}
+    part_path = get_part_path(filepath, url)
+    limiter = limiter or HostLimiter()
+    with limiter.slot(url):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                result = fetch_to_part(session, url, part_path, headers)
+                break
+            except requests.exceptions.ChunkedEncodingError as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                attempt += 1
+                inc('download_retries_total', host=urlsplit(url).netloc)
+                print(f'Загрузка {url} прервалась: {e}. Докачка через {delay:.1f} с')
+                time.sleep(delay)
+        elapsed = time.monotonic() - started
+    host = urlsplit(url).netloc
+    observe('download_seconds', elapsed, host=host)
+
+    if result is None:
+        cache.not_modified(url)
+        return 'skipped', 0
+    response_headers, size, received, sha256 = result
+    inc('download_bytes_total', received, host=host)
+    if store:
+        filepath, is_new = store.save(url, part_path, sha256, size, filepath, metadata)
+        if not is_new:
+            print(f'{url}: уже сохранено как {filepath.name}')
+            return 'duplicate', received
+    else:
+        os.replace(part_path, filepath)
+    if cache:
+        cache.remember(url, response_headers, filepath)
+
+    speed = received / elapsed if elapsed else 0
+    resumed = f', докачано {format_size(received)}' if received < size else ''
+    print(f'{filepath.name}: {format_size(size)}{resumed} за {elapsed:.1f} с ({format_size(speed)}/с)')
+    return 'downloaded', received
+
+
+def run_downloads(tasks, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, session=None, store=None, cache=None, limiter=None):
+    """Выполняет загрузки из очереди задач с ограниченной параллельностью
+
+    Задачи читаются из итератора по мере надобности: одновременно в работе
+    не больше чем `workers * 2` задач, так что можно передавать генератор.
+    Файл, который не удалось скачать даже после повторов, учитывается
+    как 'failed' и не прерывает остальные загрузки. Итоги по статусам
+    и число задач в работе (download_queue_depth) пишутся в метрики.
+
+    Args:
+        tasks: Итерируемый объект троек (url, путь к файлу, метаданные)
+        workers: Количество потоков загрузки
+        per_host: Максимум одновременных соединений к одному хосту
+        session: Сессия requests (по умолчанию — общая сессия процесса)
+        store: Хранилище ImageStore для пропуска и дедупликации (или None)
+        cache: Кэш HttpCache для условных запросов (или None)
+        limiter: Общий HostLimiter (по умолчанию — свой, с лимитом per_host)
+
+    Returns:
+        Counter: Количество файлов по статусам и общий объём в 'bytes'
+    """
+    session = session or get_session()
+    limiter = limiter or HostLimiter(per_host)
+    stats = Counter()
+
+    def collect(url, get_result):
+        try:
+            status, size = get_result()
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f'Не удалось скачать {url}: {e}')
+            status, size = 'failed', 0
+        stats[status] += 1
+        stats['bytes'] += size
+        inc('downloads_total', status=status)
+
+    if workers <= 1:
+        for url, filepath, metadata in tasks:
+            collect(url, lambda: download_image(session, url, filepath, limiter, store, cache, metadata))
+        return stats
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for url, filepath, metadata in tasks:
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(pending.pop(future), future.result)
+            future = executor.submit(download_image, session, url, filepath, limiter, store, cache, metadata)
+            pending[future] = url
+            set_gauge('download_queue_depth', len(pending))
+        for future, url in pending.items():
+            collect(url, future.result)
+        set_gauge('download_queue_depth', 0)
+    return stats
+
+
+def format_stats(stats):
+    """Формирует строку-итог по результату run_downloads"""
+    return (
+        f"скачано: {stats['downloaded']}, пропущено: {stats['skipped']}, "
+        f"дубликатов: {stats['duplicate']}, ошибок: {stats['failed']}, объём: {format_size(stats['bytes'])}"
+    )
+
+
+def iter_image_tasks(image_urls, folder, filename_prefix, content_named=False):
+    """Превращает ссылки на изображения в задачи (url, путь к файлу, метаданные) для run_downloads
+
+    Args:
+        image_urls: Ссылки на изображения или пары (ссылка, метаданные)
+        folder: Папка для сохранения (создаётся при первой задаче)
         filename_prefix: Имя файла
+        content_named: Не нумеровать файлы — хранилище само добавит хэш содержимого
     """
     folder = Path(folder)
     folder.mkdir(parents=True, exist_ok=True)
-
-    for index, url in enumerate(image_urls, start=1):
-        response = requests.get(url)
-        response.raise_for_status()
+    for index, item in enumerate(image_urls, start=1):
+        url, metadata = (item, None) if isinstance(item, str) else item
         ext = get_file_extension(url) or '.jpg'
-        filename = f'{filename_prefix}_{index}{ext}'
-        filepath = folder / filename
+        name = filename_prefix if content_named else f'{filename_prefix}_{index}'
+        yield url, folder / f'{name}{ext}', metadata
+
+
+def download_images(image_urls, folder, filename_prefix, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, store=None, cache=None):
+    """Скачивает изображения по URL и сохраняет в указанную папку
+
+    Args:
+        image_urls: Ссылки на изображения или пары (ссылка, метаданные)
+        folder: Папка для сохранения (объект Path или строка)
+        filename_prefix: Имя файла
+        workers: Количество параллельных загрузок (1 — последовательно)
+        per_host: Максимум одновременных соединений к одному хосту
+        store: Хранилище ImageStore. С ним файлы называются по хэшу
+            содержимого ({prefix}_{hash}{ext}), а не по порядковому номеру.
+        cache: Кэш HttpCache: уже скачанные файлы перепроверяются условным
+            запросом вместо повторной загрузки.
+
+    Returns:
+        Counter: Количество файлов по статусам и общий объём в 'bytes'
+    """
+    tasks = iter_image_tasks(image_urls, folder, filename_prefix, content_named=store is not None)
+    return run_downloads(tasks, workers=workers, per_host=per_host, store=store, cache=cache)
+
+
+def download_groups(groups, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, store=None, cache=None, limiter=None):
+    """Скачивает несколько групп изображений, каждую в свою папку, одним пулом загрузок
 
-        with open(filepath, 'wb') as file:
-            file.write(response.content)
+    Группы читаются по мере надобности, поэтому можно передавать генератор,
+    который получает их постранично из API.
+
+    Args:
+        groups: Итерируемый объект троек (ссылки, папка, префикс имени файла)
+        workers: Количество параллельных загрузок (1 — последовательно)
+        per_host: Максимум одновременных соединений к одному хосту
+        store: Общее хранилище ImageStore (его папка должна включать папки групп)
+        cache: Кэш HttpCache для условных запросов
+        limiter: Общий HostLimiter, если лимиты нужно разделить с другими загрузками
+
+    Returns:
+        Counter: Количество файлов по статусам и общий объём в 'bytes'
+    """
+    tasks = chain.from_iterable(
+        iter_image_tasks(image_urls, folder, filename_prefix, content_named=store is not None)
+        for image_urls, folder, filename_prefix in groups
+    )
+    return run_downloads(tasks, workers=workers, per_host=per_host, store=store, cache=cache, limiter=limiter)
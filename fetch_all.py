@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import os
+import time
+from datetime import date
+from pathlib import Path
+from dotenv import load_dotenv
+from download_utils import HostLimiter, download_groups, format_stats, DEFAULT_PER_HOST
+from http_cache import HttpCache, DEFAULT_TTL
+from metrics import MetricsExporter
+from image_store import ImageStore
+from sources import ApodSource, EpicSource, SpaceXSource
+
+SOURCE_NAMES = ('spacex', 'apod', 'epic')
+DEFAULT_BUDGET = 8
+
+
+async def run_source(source, limiter, workers, cache=None, use_store=True):
+    """Скачивает фото одного источника в общем пуле ограничений.
+
+    Сетевые запросы выполняются в отдельном потоке, чтобы не блокировать
+    цикл событий, а ограничитель limiter общий для всех источников.
+
+    Returns:
+        tuple: (Counter со статистикой загрузок, время работы в секундах)
+    """
+    started = time.monotonic()
+    store = ImageStore(source.folder) if use_store else None
+    try:
+        stats = await asyncio.to_thread(
+            download_groups,
+            source.iter_groups(cache=cache),
+            workers=workers,
+            store=store,
+            cache=cache,
+            limiter=limiter
+        )
+    finally:
+        if store:
+            store.close()
+    return stats, time.monotonic() - started
+
+
+async def fetch_all(sources, budget=DEFAULT_BUDGET, per_host=DEFAULT_PER_HOST, cache=None, use_store=True):
+    """Запускает все источники одновременно в одном цикле событий.
+
+    Все источники делят одну сессию с пулом соединений и общий бюджет
+    одновременных загрузок: в сумме не больше budget, к одному хосту
+    не больше per_host. Ошибка одного источника не прерывает остальные.
+
+    Args:
+        sources (list): Источники (наследники sources.Source)
+        budget (int): Общий лимит одновременных загрузок
+        per_host (int): Лимит одновременных загрузок с одного хоста
+        cache (HttpCache, optional): Общий кэш HTTP-ответов
+        use_store (bool): Вести индекс скачанного в папке каждого источника
+
+    Returns:
+        dict: Имя источника → (статистика, время) или исключение
+    """
+    limiter = HostLimiter(per_host, total=budget)
+    results = await asyncio.gather(
+        *(run_source(source, limiter, budget, cache, use_store) for source in sources),
+        return_exceptions=True
+    )
+    return {source.name: result for source, result in zip(sources, results)}
+
+
+def print_report(results, elapsed):
+    """Печатает итоговый отчёт по всем источникам"""
+    print(f'\nИтого за {elapsed:.1f} с:')
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f'  {name}: ошибка — {result}')
+        else:
+            stats, source_elapsed = result
+            print(f'  {name}: {format_stats(stats)} ({source_elapsed:.1f} с)')
+
+
+def parse_arguments(default_key=None):
+    """Парсит аргументы командной строки.
+
+    Args:
+        default_key: Значение ключа NASA по умолчанию (из окружения)
+
+    Returns:
+        Namespace: Объект с аргументами командной строки
+    """
+    parser = argparse.ArgumentParser(description='Скачивание фото из всех источников (SpaceX, NASA APOD, NASA EPIC) одним процессом')
+    parser.add_argument('--key', default=default_key, help='NASA API ключ')
+    parser.add_argument('--sources', nargs='+', choices=SOURCE_NAMES, default=list(SOURCE_NAMES), help='Источники (по умолчанию: все)')
+    parser.add_argument('--count', type=int, default=30, metavar='', help='Количество случайных фото APOD')
+    parser.add_argument('--start', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Скачать архив всех источников начиная с этой даты')
+    parser.add_argument('--end', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Последняя дата архива (по умолчанию — сегодня)')
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET, metavar='', help=f'Всего одновременных загрузок (по умолчанию: {DEFAULT_BUDGET})')
+    parser.add_argument('--per_host', type=int, default=DEFAULT_PER_HOST, metavar='', help=f'Макс. соединений к одному хосту (по умолчанию: {DEFAULT_PER_HOST})')
+    parser.add_argument('--cache_ttl', type=int, default=DEFAULT_TTL, metavar='', help=f'Сколько секунд ответ API считается свежим (по умолчанию: {DEFAULT_TTL})')
+    parser.add_argument('--no_cache', action='store_true', help='Не использовать HTTP-кэш')
+    parser.add_argument('--no_store', action='store_true', help='Не вести индекс скачанного: качать всё заново и называть файлы по номеру')
+    parser.add_argument('--metrics_port', type=int, metavar='', help='Отдавать метрики в формате Prometheus на этом порту во время загрузки')
+    parser.add_argument('--metrics_file', type=Path, metavar='', help='Дописать снимок метрик в этот файл (JSON Lines)')
+    return parser.parse_args()
+
+
+def main():
+    load_dotenv()
+    args = parse_arguments(default_key=os.getenv('NASA_API_KEY'))
+
+    available = {
+        'spacex': lambda: SpaceXSource(start_date=args.start, end_date=args.end),
+        'apod': lambda: ApodSource(args.key, count=args.count, start_date=args.start, end_date=args.end),
+        'epic': lambda: EpicSource(args.key, start_date=args.start, end_date=args.end),
+    }
+    sources = [available[name]() for name in args.sources]
+
+    cache = None if args.no_cache else HttpCache(ttl=args.cache_ttl)
+    exporter = MetricsExporter(port=args.metrics_port, path=args.metrics_file)
+    exporter.start()
+    started = time.monotonic()
+    try:
+        results = asyncio.run(fetch_all(
+            sources,
+            budget=args.budget,
+            per_host=args.per_host,
+            cache=cache,
+            use_store=not args.no_store
+        ))
+    finally:
+        if cache:
+            cache.close()
+        exporter.close()
+    print_report(results, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
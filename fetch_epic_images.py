@@ -1,16 +1,131 @@
 import argparse
 import os
-from dotenv import load_dotenv
 import requests
-from download_utils import download_images
-from datetime import datetime
+from dotenv import load_dotenv
+from download_utils import download_images, format_stats, DEFAULT_PER_HOST
+from image_store import ImageStore
+from http_cache import HttpCache, fetch_json, DEFAULT_TTL
+from metrics import MetricsExporter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+
+EPIC_API_URL = 'https://api.nasa.gov/EPIC/api'
+EPIC_ARCHIVE_URL = 'https://epic.gsfc.nasa.gov/archive'
+COLLECTIONS = ('natural', 'enhanced')
+ARCHIVE_TTL = 30 * 24 * 3600
+# EPIC выкладывает снимки с задержкой: список дня считается окончательным
+# только спустя столько дней
+SETTLE_DAYS = 3
+
+
+def get_image_url(image, collection='natural'):
+    """Строит ссылку на PNG-снимок в архиве EPIC по записи из API"""
+    capture_date = datetime.fromisoformat(image['date'])
+    formatted_date = capture_date.strftime('%Y/%m/%d')
+    return f"{EPIC_ARCHIVE_URL}/{collection}/{formatted_date}/png/{image['image']}.png"
+
+
+def get_image_metadata(image):
+    """Метаданные снимка EPIC для индекса ImageStore"""
+    return {
+        'source': 'epic',
+        'title': image.get('caption'),
+        'captured_at': datetime.fromisoformat(image['date']).isoformat()
+    }
 
 
-def fetch_epic_photos(api_key, folder, filename_prefix, max_downloads=None):
+def iter_range_image_urls(api_key, start_date, end_date, collection='natural', cache=None, workers=4, failed_days=None):
+    """Перечисляет ссылки на снимки EPIC за диапазон дат.
+
+    Списки снимков за отдельные дни запрашиваются параллельно, а ссылки
+    отдаются по мере готовности каждого дня, так что загрузка начинается,
+    не дожидаясь всего списка. В работе одновременно не больше workers
+    дней: следующий день запрашивается, когда готов предыдущий, а если
+    перебор остановили (например, по лимиту загрузок), ещё не начатые
+    запросы отменяются и не тратят квоту API. Непустые списки дней старше
+    SETTLE_DAYS дней в архиве уже не меняются, поэтому кэшируются надолго:
+    после прерывания повторный запуск не запрашивает их заново. Недавние
+    дни и пустые списки (снимки могли ещё не выложить) живут в кэше
+    обычный срок. День, список которого не удалось получить даже после
+    повторов, пропускается, а не прерывает весь перебор.
+
+    Args:
+        api_key (str): Ключ API NASA
+        start_date (date): Первый день диапазона
+        end_date (date): Последний день диапазона (включительно)
+        collection (str): 'natural' или 'enhanced'
+        cache (HttpCache, optional): Кэш HTTP-ответов
+        workers (int): Количество параллельных запросов к API
+        failed_days (list, optional): Сюда добавляются дни, список
+            которых получить не удалось
+
+    Yields:
+        tuple: (ссылка на снимок, метаданные снимка)
+    """
+    today = date.today()
+    days = (start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1))
+
+    def list_day(day):
+        url = f'{EPIC_API_URL}/{collection}/date/{day.isoformat()}'
+        params = {'api_key': api_key}
+        if day > today - timedelta(days=SETTLE_DAYS):
+            return fetch_json(url, params=params, cache=cache)
+        images = fetch_json(url, params=params, cache=cache, ttl=ARCHIVE_TTL)
+        if not images:
+            images = fetch_json(url, params=params, cache=cache)
+        return images
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {executor.submit(list_day, day): day for day in islice(days, workers)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                day = pending.pop(future)
+                for next_day in islice(days, 1):
+                    pending[executor.submit(list_day, next_day)] = next_day
+                try:
+                    images = future.result()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    print(f'{day}: не удалось получить список снимков ({e}), день пропущен')
+                    if failed_days is not None:
+                        failed_days.append(day)
+                    continue
+                print(f'{day}: найдено {len(images)} снимков')
+                for image in images:
+                    yield get_image_url(image, collection), get_image_metadata(image)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_latest_image_urls(api_key, collection='natural', cache=None):
+    """Возвращает пары (ссылка, метаданные) для снимков EPIC за последний доступный день"""
+    url = f'{EPIC_API_URL}/{collection}/images'
+    earth_images = fetch_json(url, params={'api_key': api_key}, cache=cache)
+    return [(get_image_url(image, collection), get_image_metadata(image)) for image in earth_images]
+
+
+def fetch_epic_photos(
+        api_key,
+        folder,
+        filename_prefix,
+        max_downloads=None,
+        workers=1,
+        per_host=DEFAULT_PER_HOST,
+        use_store=True,
+        cache=None,
+        start_date=None,
+        end_date=None,
+        collection='natural'
+        ):
     """
-    Скачивает последние фотографии Земли NASA API.
+    Скачивает фотографии Земли NASA API.
 
-    Запрашивает данные из NASA API EPIC и скачивает до 10 последних фотографий Земли в формате PNG.
+    Запрашивает данные из NASA API EPIC и скачивает последние фотографии Земли в формате PNG.
+    Если указан start_date, скачивает архив снимков за диапазон дат.
 
     Args:
         api_key (str): Ключ API NASA
@@ -18,35 +133,50 @@ def fetch_epic_photos(api_key, folder, filename_prefix, max_downloads=None):
         filename_prefix (str): Префикс имени файла для сохраненных изображений
         max_downloads (int, optional): Максимальное количество фото.
             Если None — скачивает все доступные. По умолчанию None.
+        workers (int, optional): Количество параллельных загрузок
+        per_host (int, optional): Максимум одновременных соединений к одному хосту
+        use_store (bool, optional): Пропускать уже скачанные URL и не сохранять
+            одинаковые файлы повторно (индекс в папке .images.sqlite)
+        cache (HttpCache, optional): Кэш HTTP-ответов для запросов к API
+            и условной перепроверки картинок
+        start_date (date, optional): Первый день архива для скачивания
+        end_date (date, optional): Последний день архива (по умолчанию — сегодня)
+        collection (str, optional): Коллекция снимков: 'natural' или 'enhanced'
 
     Returns:
         None
     """
-    url = 'https://api.nasa.gov/EPIC/api/natural/images'
-    params = {
-        'api_key': api_key
-    }
-
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-
-    earth_images = response.json()
-    image_urls = []
-    for image in earth_images:
-        capture_date = datetime.fromisoformat(image['date'])
-        formatted_date = capture_date.strftime('%Y/%m/%d')
-        image_name = image['image']
-        url = f"https://epic.gsfc.nasa.gov/archive/natural/{formatted_date}/png/{image_name}.png"
-        image_urls.append(url)
-
-    images_to_download = image_urls[:max_downloads] if max_downloads else image_urls
-    print(f'Скачиваю {len(images_to_download)} изображений...')
-    download_images(
-        image_urls=images_to_download,
-        folder=folder,
-        filename_prefix=filename_prefix
-    )
-    print('Готово!')
+    failed_days = []
+    if start_date:
+        end_date = end_date or date.today()
+        image_urls = iter_range_image_urls(api_key, start_date, end_date, collection, cache=cache, workers=max(workers, 1), failed_days=failed_days)
+        images_to_download = islice(image_urls, max_downloads) if max_downloads else image_urls
+        print(f'Скачиваю снимки {collection} за {start_date} — {end_date}...')
+    else:
+        image_urls = get_latest_image_urls(api_key, collection, cache=cache)
+        images_to_download = image_urls[:max_downloads] if max_downloads else image_urls
+        print(f'Скачиваю {len(images_to_download)} изображений...')
+
+    store = ImageStore(folder) if use_store else None
+    try:
+        stats = download_images(
+            image_urls=images_to_download,
+            folder=folder,
+            filename_prefix=filename_prefix,
+            workers=workers,
+            per_host=per_host,
+            store=store,
+            cache=cache
+        )
+    finally:
+        if start_date:
+            image_urls.close()
+        if store:
+            store.close()
+    print(f'Готово! {format_stats(stats)}')
+    if failed_days:
+        days = ', '.join(str(day) for day in sorted(failed_days))
+        print(f'Не удалось получить списки снимков за {len(failed_days)} дн.: {days}. Запустите загрузку за них повторно')
 
 
 def parse_arguments(default_key=None, default_folder='epic_images'):
@@ -67,6 +197,16 @@ def parse_arguments(default_key=None, default_folder='epic_images'):
     parser.add_argument('--folder', default=default_folder, metavar='', help='Папка для сохранения')
     parser.add_argument('--filename_prefix', default='epic_photo', metavar='', help='Имя файлов (по умолчанию: epic_photo)')
     parser.add_argument('-md', '--max_downloads', type=int, default=None, metavar='', help='Макс. количество фото (по умолчанию — все)')
+    parser.add_argument('--collection', choices=COLLECTIONS, default='natural', help='Коллекция снимков (по умолчанию: natural)')
+    parser.add_argument('--start', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Скачать архив начиная с этой даты')
+    parser.add_argument('--end', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Последняя дата архива (по умолчанию — сегодня)')
+    parser.add_argument('-w', '--workers', type=int, default=4, metavar='', help='Количество параллельных загрузок (по умолчанию: 4)')
+    parser.add_argument('--per_host', type=int, default=DEFAULT_PER_HOST, metavar='', help=f'Макс. соединений к одному хосту (по умолчанию: {DEFAULT_PER_HOST})')
+    parser.add_argument('--cache_ttl', type=int, default=DEFAULT_TTL, metavar='', help=f'Сколько секунд ответ API считается свежим (по умолчанию: {DEFAULT_TTL})')
+    parser.add_argument('--no_cache', action='store_true', help='Не использовать HTTP-кэш')
+    parser.add_argument('--no_store', action='store_true', help='Не вести индекс скачанного: качать всё заново и называть файлы по номеру')
+    parser.add_argument('--metrics_port', type=int, metavar='', help='Отдавать метрики в формате Prometheus на этом порту во время загрузки')
+    parser.add_argument('--metrics_file', type=Path, metavar='', help='Дописать снимок метрик в этот файл (JSON Lines)')
     return parser.parse_args()
 
 
@@ -76,12 +216,27 @@ def main():
     default_folder = 'epic_images'
     args = parse_arguments(default_key=env_key, default_folder=default_folder)
 
-    fetch_epic_photos(
-        api_key=args.key,
-        folder=args.folder,
-        filename_prefix=args.filename_prefix,
-        max_downloads=args.max_downloads
-    )
+    cache = None if args.no_cache else HttpCache(ttl=args.cache_ttl)
+    exporter = MetricsExporter(port=args.metrics_port, path=args.metrics_file)
+    exporter.start()
+    try:
+        fetch_epic_photos(
+            api_key=args.key,
+            folder=args.folder,
+            filename_prefix=args.filename_prefix,
+            max_downloads=args.max_downloads,
+            workers=args.workers,
+            per_host=args.per_host,
+            use_store=not args.no_store,
+            cache=cache,
+            start_date=args.start,
+            end_date=args.end,
+            collection=args.collection
+        )
+    finally:
+        if cache:
+            cache.close()
+        exporter.close()
 
 
 if __name__ == '__main__':
@@ -1,47 +1,202 @@
 import argparse
 import os
-from dotenv import load_dotenv
 import requests
-from download_utils import download_images
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from pathlib import Path
+from dotenv import load_dotenv
+from download_utils import download_images, format_stats, DEFAULT_PER_HOST
+from image_store import ImageStore
+from http_cache import HttpCache, fetch_json, DEFAULT_TTL
+from metrics import MetricsExporter
+
+
+APOD_URL = 'https://api.nasa.gov/planetary/apod'
+CHUNK_DAYS = 31
+ARCHIVE_TTL = 30 * 24 * 3600
+QUALITIES = ('hd', 'sd')
+
 
+def get_apod_image_url(item, quality='hd'):
+    """Выбирает ссылку на картинку из записи APOD.
 
-def fetch_nasa_photos(api_key, folder, filename_prefix, count=30):
+    Для фото берётся hdurl (при quality='hd' и если он есть) или url,
+    для видео — превью thumbnail_url.
+
+    Returns:
+        str: Ссылка на картинку или None, если картинки нет
     """
-    Скачивает изображения NASA API.
+    if item.get('media_type') == 'video':
+        return item.get('thumbnail_url')
+    if quality == 'hd' and item.get('hdurl'):
+        return item['hdurl']
+    return item.get('url')
+
+
+def get_apod_metadata(item):
+    """Метаданные снимка дня для индекса ImageStore"""
+    return {'source': 'apod', 'title': item.get('title'), 'captured_at': item.get('date')}
 
-    Запрашивает данные из NASA API EPIC и скачивает до 10 последних фотографий Земли в формате PNG.
+
+def split_date_range(start_date, end_date, chunk_days=CHUNK_DAYS):
+    """Делит диапазон дат на непересекающиеся отрезки не длиннее chunk_days дней"""
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def iter_range_image_urls(api_key, start_date, end_date=None, quality='hd', cache=None, workers=4, failed_chunks=None):
+    """Перечисляет ссылки на картинки APOD за диапазон дат.
+
+    Диапазон делится на отрезки по CHUNK_DAYS дней, которые запрашиваются
+    параллельно; ссылки отдаются по мере готовности каждого отрезка.
+    Каждый день попадает ровно в один отрезок, а повторные записи
+    за один день отбрасываются. Если end_date не указан, последний отрезок
+    запрашивается без end_date: APOD сам подставляет свою текущую дату
+    (по времени США), а явная дата, которая там ещё не наступила, вернула
+    бы ошибку 400. Отрезок, который не удалось получить даже после
+    повторов, пропускается, а не прерывает весь перебор.
 
     Args:
         api_key (str): Ключ API NASA
-        folder (str): Папка для сохранения изображений
-        filename_prefix (str): Префикс имени файла для сохраненных изображений
-        count (int): Количество изображений для загрузки (по умолчанию 30)
+        start_date (date): Первый день диапазона
+        end_date (date, optional): Последний день диапазона (включительно),
+            по умолчанию — текущий день APOD
+        quality (str): 'hd' — предпочитать hdurl, 'sd' — брать url
+        cache (HttpCache, optional): Кэш HTTP-ответов
+        workers (int): Количество параллельных запросов к API
+        failed_chunks (list, optional): Сюда добавляются отрезки
+            (первый и последний день), которые получить не удалось
+
+    Yields:
+        tuple: (ссылка на картинку, метаданные снимка)
+    """
+    today = date.today()
+    chunks = split_date_range(start_date, end_date or today)
+    open_chunk = chunks[-1] if end_date is None and chunks else None
+
+    def list_chunk(chunk):
+        chunk_start, chunk_end = chunk
+        params = {
+            'api_key': api_key,
+            'start_date': chunk_start.isoformat(),
+            'thumbs': True
+        }
+        if chunk != open_chunk:
+            params['end_date'] = chunk_end.isoformat()
+        ttl = ARCHIVE_TTL if chunk_end < today and chunk != open_chunk else None
+        return fetch_json(APOD_URL, params=params, cache=cache, ttl=ttl)
+
+    seen_dates = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(list_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk_start, chunk_end = futures[future]
+            try:
+                items = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f'{chunk_start} — {chunk_end}: не удалось получить записи ({e}), отрезок пропущен')
+                if failed_chunks is not None:
+                    failed_chunks.append((chunk_start, chunk_end))
+                continue
+            print(f'{chunk_start} — {chunk_end}: найдено {len(items)} записей')
+            for item in items:
+                if item['date'] in seen_dates:
+                    continue
+                seen_dates.add(item['date'])
+                image_url = get_apod_image_url(item, quality)
+                if image_url:
+                    yield image_url, get_apod_metadata(item)
+
+
+def get_random_image_urls(api_key, count=30, quality='sd'):
+    """Возвращает ссылки на count случайных снимков дня APOD.
+
+    Ответ с count каждый раз случайный, поэтому он не кэшируется.
 
     Returns:
-        None
+        list: Пары (ссылка на картинку, метаданные снимка)
     """
-    url = 'https://api.nasa.gov/planetary/apod'
     params = {
         'api_key': api_key,
         'count': count,
         'thumbs': True
     }
+    apod_images = fetch_json(APOD_URL, params=params)
+    images = [(get_apod_image_url(item, quality), get_apod_metadata(item)) for item in apod_images]
+    return [(image_url, metadata) for image_url, metadata in images if image_url]
+
+
+def fetch_nasa_photos(
+        api_key,
+        folder,
+        filename_prefix,
+        count=30,
+        workers=1,
+        per_host=DEFAULT_PER_HOST,
+        use_store=True,
+        cache=None,
+        start_date=None,
+        end_date=None,
+        quality='sd'
+        ):
+    """
+    Скачивает изображения NASA API.
 
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    apod_images = response.json()
-    image_urls = [item['url'] for item in apod_images if item['media_type'] == 'image']
+    Запрашивает данные из NASA APOD и скачивает count случайных снимков дня.
+    Если указан start_date, скачивает снимки за каждый день диапазона дат.
+    Для видео скачивается превью.
 
-    if not image_urls:
-        return
+    Args:
+        api_key (str): Ключ API NASA
+        folder (str): Папка для сохранения изображений
+        filename_prefix (str): Префикс имени файла для сохраненных изображений
+        count (int): Количество изображений для загрузки (по умолчанию 30)
+        workers (int): Количество параллельных загрузок
+        per_host (int): Максимум одновременных соединений к одному хосту
+        use_store (bool): Пропускать уже скачанные URL и не сохранять
+            одинаковые файлы повторно (индекс в папке .images.sqlite)
+        cache (HttpCache): Кэш HTTP-ответов для запросов к API
+            и условной перепроверки картинок
+        start_date (date): Первый день диапазона
+        end_date (date): Последний день диапазона (по умолчанию — сегодня)
+        quality (str): 'hd' — оригиналы в высоком разрешении, 'sd' — облегчённые версии
+
+    Returns:
+        None
+    """
+    failed_chunks = []
+    if start_date:
+        image_urls = iter_range_image_urls(api_key, start_date, end_date, quality, cache=cache, workers=max(workers, 1), failed_chunks=failed_chunks)
+        print(f'Скачиваю снимки дня за {start_date} — {end_date or "сегодня"}...')
+    else:
+        image_urls = get_random_image_urls(api_key, count, quality)
+        if not image_urls:
+            return
+        print(f'Найдено {len(image_urls)} фото. Скачиваю...')
 
-    print(f'Найдено {len(image_urls)} фото. Скачиваю...')
-    download_images(
-        image_urls=image_urls,
-        folder=folder,
-        filename_prefix=filename_prefix
-    )
-    print('Готово!')
+    store = ImageStore(folder) if use_store else None
+    try:
+        stats = download_images(
+            image_urls=image_urls,
+            folder=folder,
+            filename_prefix=filename_prefix,
+            workers=workers,
+            per_host=per_host,
+            store=store,
+            cache=cache
+        )
+    finally:
+        if store:
+            store.close()
+    print(f'Готово! {format_stats(stats)}')
+    if failed_chunks:
+        chunks = ', '.join(f'{chunk_start} — {chunk_end}' for chunk_start, chunk_end in sorted(failed_chunks))
+        print(f'Не удалось получить записи за отрезки: {chunks}. Запустите загрузку за них повторно')
 
 
 def parse_arguments(default_key=None, default_folder='nasa_images'):
@@ -62,6 +217,16 @@ def parse_arguments(default_key=None, default_folder='nasa_images'):
     parser.add_argument('--folder', default=default_folder, metavar='', help='Папка для сохранения')
     parser.add_argument('--filename_prefix', default='nasa', metavar='', help='Имя файлов (по умолчанию: nasa)')
     parser.add_argument('--count', type=int, default=30, metavar='', help='Количество фото')
+    parser.add_argument('--start_date', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Скачать снимки дня начиная с этой даты (вместо --count)')
+    parser.add_argument('--end_date', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Последняя дата (по умолчанию — сегодня)')
+    parser.add_argument('--quality', choices=QUALITIES, default='sd', help='hd — оригиналы, sd — облегчённые версии (по умолчанию: sd)')
+    parser.add_argument('-w', '--workers', type=int, default=4, metavar='', help='Количество параллельных загрузок (по умолчанию: 4)')
+    parser.add_argument('--per_host', type=int, default=DEFAULT_PER_HOST, metavar='', help=f'Макс. соединений к одному хосту (по умолчанию: {DEFAULT_PER_HOST})')
+    parser.add_argument('--cache_ttl', type=int, default=DEFAULT_TTL, metavar='', help=f'Сколько секунд ответ API считается свежим (по умолчанию: {DEFAULT_TTL})')
+    parser.add_argument('--no_cache', action='store_true', help='Не использовать HTTP-кэш')
+    parser.add_argument('--no_store', action='store_true', help='Не вести индекс скачанного: качать всё заново и называть файлы по номеру')
+    parser.add_argument('--metrics_port', type=int, metavar='', help='Отдавать метрики в формате Prometheus на этом порту во время загрузки')
+    parser.add_argument('--metrics_file', type=Path, metavar='', help='Дописать снимок метрик в этот файл (JSON Lines)')
     return parser.parse_args()
 
 
@@ -71,12 +236,27 @@ def main():
     default_folder = 'nasa_images'
     args = parse_arguments(default_key=env_key, default_folder=default_folder)
 
-    fetch_nasa_photos(
-        api_key=args.key,
-        folder=args.folder,
-        filename_prefix=args.filename_prefix,
-        count=args.count
-    )
+    cache = None if args.no_cache else HttpCache(ttl=args.cache_ttl)
+    exporter = MetricsExporter(port=args.metrics_port, path=args.metrics_file)
+    exporter.start()
+    try:
+        fetch_nasa_photos(
+            api_key=args.key,
+            folder=args.folder,
+            filename_prefix=args.filename_prefix,
+            count=args.count,
+            workers=args.workers,
+            per_host=args.per_host,
+            use_store=not args.no_store,
+            cache=cache,
+            start_date=args.start_date,
+            end_date=args.end_date,
+            quality=args.quality
+        )
+    finally:
+        if cache:
+            cache.close()
+        exporter.close()
 
 
 if __name__ == '__main__':
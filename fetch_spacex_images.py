@@ -1,9 +1,30 @@
 import argparse
-import requests
-from download_utils import download_images
+import re
+from datetime import date
+from pathlib import Path
+from download_utils import download_images, download_groups, format_stats, DEFAULT_PER_HOST
+from http_client import request
+from image_store import ImageStore
+from http_cache import HttpCache, fetch_json, DEFAULT_TTL
+from metrics import MetricsExporter
 
+SPACEX_API_URL = 'https://api.spacexdata.com/v5/launches'
+QUERY_PAGE_SIZE = 100
 
-def fetch_spacex_photos(launch_id=None, folder='images', filename_prefix='spacex'):
+
+def get_launch_metadata(launch):
+    """Метаданные фото запуска для индекса ImageStore"""
+    return {'source': 'spacex', 'title': launch.get('name'), 'captured_at': launch.get('date_utc')}
+
+
+def get_launch_photos(launch_id=None, cache=None):
+    """Возвращает пары (ссылка, метаданные) для оригинальных фото запуска (по умолчанию — последнего)"""
+    launch = fetch_json(f'{SPACEX_API_URL}/{launch_id or "latest"}', cache=cache)
+    metadata = get_launch_metadata(launch)
+    return [(url, metadata) for url in launch.get('links', {}).get('flickr', {}).get('original', [])]
+
+
+def fetch_spacex_photos(launch_id=None, folder='images', filename_prefix='spacex', workers=1, per_host=DEFAULT_PER_HOST, use_store=True, cache=None):
     """
     Скачивает фотографии запусков SpaceX с помощью официального API.
 
@@ -15,6 +36,12 @@ def fetch_spacex_photos(launch_id=None, folder='images', filename_prefix='spacex
             последнего запуска. Пример ID: '5eb87d42ffd86e000604b384'
         folder (str, optional): Путь к папке для сохранения фотографий
         filename_prefix (str, optional): Префикс имени файлов
+        workers (int, optional): Количество параллельных загрузок
+        per_host (int, optional): Максимум одновременных соединений к одному хосту
+        use_store (bool, optional): Пропускать уже скачанные URL и не сохранять
+            одинаковые файлы повторно (индекс в папке .images.sqlite)
+        cache (HttpCache, optional): Кэш HTTP-ответов для запросов к API
+            и условной перепроверки картинок
 
     Returns:
         None
@@ -23,19 +50,139 @@ def fetch_spacex_photos(launch_id=None, folder='images', filename_prefix='spacex
         requests.exceptions.RequestException: При ошибке запроса к API SpaceX.
         Exception: При других непредвиденных ошибках.
     """
-    api_url = f'https://api.spacexdata.com/v5/launches/{launch_id or "latest"}'
-
-    response = requests.get(api_url)
-    response.raise_for_status()
-    photos = response.json().get('links', {}).get('flickr', {}).get('original', [])
+    photos = get_launch_photos(launch_id, cache=cache)
     if photos:
         print(f'Найдено {len(photos)} фото. Скачиваю...')
-        download_images(photos, folder, filename_prefix)
-        print('Готово!')
+        store = ImageStore(folder) if use_store else None
+        try:
+            stats = download_images(photos, folder, filename_prefix, workers=workers, per_host=per_host, store=store, cache=cache)
+        finally:
+            if store:
+                store.close()
+        print(f'Готово! {format_stats(stats)}')
     else:
         print(f'Фото не найдены для запуска {launch_id or "latest"}')
 
 
+def build_launch_query(start_date=None, end_date=None, rocket=None, success=None):
+    """Строит фильтр запусков для /v5/launches/query.
+
+    В выборку попадают только запуски, у которых есть оригинальные фото.
+    """
+    query = {'links.flickr.original.0': {'$exists': True}}
+    date_range = {}
+    if start_date:
+        date_range['$gte'] = start_date.isoformat()
+    if end_date:
+        date_range['$lte'] = f'{end_date.isoformat()}T23:59:59.999Z'
+    if date_range:
+        query['date_utc'] = date_range
+    if rocket:
+        query['rocket'] = rocket
+    if success is not None:
+        query['success'] = success
+    return query
+
+
+def iter_launches(query):
+    """Постранично перечисляет запуски SpaceX, подходящие под фильтр.
+
+    Запрашиваются только название, дата и ссылки на оригинальные фото.
+
+    Args:
+        query (dict): Фильтр запусков (см. build_launch_query)
+
+    Yields:
+        dict: Запуск с полями id, name, date_utc и links.flickr.original
+    """
+    page = 1
+    while page:
+        body = {
+            'query': query,
+            'options': {
+                'select': {'name': 1, 'date_utc': 1, 'links.flickr.original': 1},
+                'sort': {'date_utc': 'asc'},
+                'page': page,
+                'limit': QUERY_PAGE_SIZE
+            }
+        }
+        response = request('POST', f'{SPACEX_API_URL}/query', json=body)
+        response.raise_for_status()
+        result = response.json()
+        yield from result['docs']
+        page = result['nextPage'] if result.get('hasNextPage') else None
+
+
+def get_launch_folder_name(launch):
+    """Имя папки запуска: дата и название, например 2021-01-20_Starlink-16"""
+    name = re.sub(r'[^\w.-]+', '_', launch.get('name') or launch['id']).strip('_')
+    return f"{launch['date_utc'][:10]}_{name}"
+
+
+def iter_launch_groups(query, folder, filename_prefix):
+    """Перечисляет группы фото для download_groups: по одной папке на запуск
+
+    Yields:
+        tuple: (ссылки на фото, папка запуска, префикс имени файла)
+    """
+    folder = Path(folder)
+    for launch in iter_launches(query):
+        metadata = get_launch_metadata(launch)
+        photos = [(url, metadata) for url in launch['links']['flickr']['original']]
+        print(f"{launch['name']} ({launch['date_utc'][:10]}): {len(photos)} фото")
+        yield photos, folder / get_launch_folder_name(launch), filename_prefix
+
+
+def fetch_spacex_launches(
+        folder='spacex_images',
+        filename_prefix='spacex',
+        start_date=None,
+        end_date=None,
+        rocket=None,
+        success=None,
+        workers=1,
+        per_host=DEFAULT_PER_HOST,
+        use_store=True,
+        cache=None
+        ):
+    """
+    Скачивает фотографии всех запусков SpaceX, подходящих под фильтр.
+
+    Запуски выбираются постранично через /v5/launches/query, а фото всех
+    запусков идут в один общий пул загрузок. Фото каждого запуска
+    сохраняются в отдельную подпапку.
+
+    Args:
+        folder (str, optional): Путь к папке для сохранения фотографий
+        filename_prefix (str, optional): Префикс имени файлов
+        start_date (date, optional): Запуски не раньше этой даты
+        end_date (date, optional): Запуски не позже этой даты
+        rocket (str, optional): ID ракеты, например '5e9d0d95eda69973a809d1ec' (Falcon 9)
+        success (bool, optional): Только успешные (True) или только неудачные (False) запуски
+        workers (int, optional): Количество параллельных загрузок
+        per_host (int, optional): Максимум одновременных соединений к одному хосту
+        use_store (bool, optional): Пропускать уже скачанные URL и не сохранять
+            одинаковые файлы повторно (индекс в папке .images.sqlite)
+        cache (HttpCache, optional): Кэш для условной перепроверки картинок
+
+    Returns:
+        None
+
+    Raises:
+        requests.exceptions.RequestException: При ошибке запроса к API SpaceX.
+    """
+    query = build_launch_query(start_date, end_date, rocket, success)
+    print('Ищу запуски и скачиваю фото...')
+    store = ImageStore(folder) if use_store else None
+    try:
+        groups = iter_launch_groups(query, folder, filename_prefix)
+        stats = download_groups(groups, workers=workers, per_host=per_host, store=store, cache=cache)
+    finally:
+        if store:
+            store.close()
+    print(f'Готово! {format_stats(stats)}')
+
+
 def parse_arguments():
     """Парсит аргументы командной строки и загружает переменные окружения.
 
@@ -45,18 +192,59 @@ def parse_arguments():
     """
     parser = argparse.ArgumentParser(description='Скачивание фото запусков SpaceX')
     parser.add_argument('--id', metavar='', help='ID запуска (например: 5eb87d42ffd86e000604b384)\n''Оставьте пустым для последнего запуска')
+    parser.add_argument('--start', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Скачать фото всех запусков начиная с этой даты')
+    parser.add_argument('--end', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='Скачать фото всех запусков до этой даты')
+    parser.add_argument('--rocket', metavar='', help='Только запуски ракеты с этим ID (например: 5e9d0d95eda69973a809d1ec — Falcon 9)')
+    outcome = parser.add_mutually_exclusive_group()
+    outcome.add_argument('--success', dest='success', action='store_const', const=True, help='Только успешные запуски')
+    outcome.add_argument('--failed', dest='success', action='store_const', const=False, help='Только неудачные запуски')
     parser.add_argument('--folder', default='spacex_images', metavar='', help='Папка для сохранения')
     parser.add_argument('--filename_prefix', default='spacex', metavar='', help='Имя файлов')
+    parser.add_argument('-w', '--workers', type=int, default=4, metavar='', help='Количество параллельных загрузок (по умолчанию: 4)')
+    parser.add_argument('--per_host', type=int, default=DEFAULT_PER_HOST, metavar='', help=f'Макс. соединений к одному хосту (по умолчанию: {DEFAULT_PER_HOST})')
+    parser.add_argument('--cache_ttl', type=int, default=DEFAULT_TTL, metavar='', help=f'Сколько секунд ответ API считается свежим (по умолчанию: {DEFAULT_TTL})')
+    parser.add_argument('--no_cache', action='store_true', help='Не использовать HTTP-кэш')
+    parser.add_argument('--no_store', action='store_true', help='Не вести индекс скачанного: качать всё заново и называть файлы по номеру')
+    parser.add_argument('--metrics_port', type=int, metavar='', help='Отдавать метрики в формате Prometheus на этом порту во время загрузки')
+    parser.add_argument('--metrics_file', type=Path, metavar='', help='Дописать снимок метрик в этот файл (JSON Lines)')
     args = parser.parse_args()
+    if args.id and (args.start or args.end or args.rocket or args.success is not None):
+        parser.error('--id нельзя сочетать с --start, --end, --rocket, --success и --failed')
     return args
 
 
 def main():
     args = parse_arguments()
-    fetch_spacex_photos(
-        args.id, args.folder,
-        args.filename_prefix
-    )
+    cache = None if args.no_cache else HttpCache(ttl=args.cache_ttl)
+    exporter = MetricsExporter(port=args.metrics_port, path=args.metrics_file)
+    exporter.start()
+    try:
+        if args.start or args.end or args.rocket or args.success is not None:
+            fetch_spacex_launches(
+                folder=args.folder,
+                filename_prefix=args.filename_prefix,
+                start_date=args.start,
+                end_date=args.end,
+                rocket=args.rocket,
+                success=args.success,
+                workers=args.workers,
+                per_host=args.per_host,
+                use_store=not args.no_store,
+                cache=cache
+            )
+        else:
+            fetch_spacex_photos(
+                args.id, args.folder,
+                args.filename_prefix,
+                workers=args.workers,
+                per_host=args.per_host,
+                use_store=not args.no_store,
+                cache=cache
+            )
+    finally:
+        if cache:
+            cache.close()
+        exporter.close()
 
 
 if __name__ == '__main__':
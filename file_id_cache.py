@@ -0,0 +1,56 @@
+import sqlite3
+import threading
+
+DEFAULT_PATH = '.tg_file_ids.sqlite'
+
+
+class FileIdCache:
+    """Постоянное соответствие «хэш содержимого фото → file_id Telegram».
+
+    После первой загрузки Telegram возвращает file_id, по которому то же
+    фото можно отправить повторно в любой чат без передачи байтов.
+    file_id привязан к боту, поэтому ключом служит пара (ID бота, sha256).
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS file_ids (
+                bot_id TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                PRIMARY KEY (bot_id, sha256)
+            )
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Закрывает соединение с файлом кэша"""
+        with self._lock:
+            self._db.close()
+
+    def get(self, bot_id, sha256):
+        """Возвращает сохранённый file_id или None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT file_id FROM file_ids WHERE bot_id = ? AND sha256 = ?', (bot_id, sha256)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, bot_id, sha256, file_id):
+        """Запоминает file_id для содержимого фото"""
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?)', (bot_id, sha256, file_id))
+            self._db.commit()
+
+    def forget(self, bot_id, sha256):
+        """Удаляет file_id, который Telegram больше не принимает"""
+        with self._lock:
+            self._db.execute('DELETE FROM file_ids WHERE bot_id = ? AND sha256 = ?', (bot_id, sha256))
+            self._db.commit()
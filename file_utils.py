@@ -1,3 +1,5 @@
+import hashlib
+import struct
 from urllib.parse import urlsplit, unquote
 from os.path import splitext, split
 
@@ -9,3 +11,77 @@ def get_file_extension(url: str) -> str:
     filename = split(path)[1]
     _, ext = splitext(filename)
     return ext.lower()
+
+
+def format_size(size: float) -> str:
+    """Переводит размер в байтах в читаемую строку (КБ, МБ, ГБ)"""
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} ГБ'
+
+
+def file_sha256(path, chunk_size=64 * 1024) -> str:
+    """Считает sha256 файла, читая его кусками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _jpeg_size(file):
+    """Ищет в JPEG маркер SOF и читает из него размеры"""
+    file.seek(2)
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0x01 or 0xD0 <= code <= 0xD9:
+            continue
+        length = struct.unpack('>H', file.read(2))[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            _, height, width = struct.unpack('>BHH', file.read(5))
+            return width, height
+        file.seek(length - 2, 1)
+
+
+def _webp_size(head):
+    """Читает размеры из первого блока WebP (VP8, VP8L или VP8X)"""
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None
+
+
+def get_image_size(path):
+    """Читает ширину и высоту из заголовка PNG, GIF, JPEG или WebP.
+
+    Картинка не декодируется: читаются только первые байты файла
+    (для JPEG — до маркера с размерами).
+
+    Returns:
+        tuple: (ширина, высота) или None, если формат не распознан
+    """
+    try:
+        with open(path, 'rb') as file:
+            head = file.read(32)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                return _webp_size(head)
+            if head[:2] == b'\xff\xd8':
+                return _jpeg_size(file)
+    except struct.error:
+        return None
+    return None
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from requests import Request
+from http_client import request
+from metrics import inc
+
+DEFAULT_CACHE_DIR = '.http_cache'
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+INDEX_FILENAME = 'index.sqlite'
+
+
+def cache_key(url, params=None):
+    """Строит ключ кэша по URL и параметрам запроса.
+
+    В индекс попадает только хэш, поэтому ключ API не хранится на диске
+    в открытом виде.
+    """
+    prepared = Request('GET', url, params=params).prepare()
+    return hashlib.sha256(prepared.url.encode()).hexdigest()
+
+
+class HttpCache:
+    """Постоянный кэш HTTP-ответов с ревалидацией и LRU-вытеснением.
+
+    Пока запись моложе `ttl` секунд, ответ отдаётся с диска без запроса.
+    Устаревшая запись перепроверяется условным запросом (If-None-Match /
+    If-Modified-Since); ответ 304 продлевает её жизнь без скачивания тела.
+    Когда суммарный объём тел превышает `max_bytes`, удаляются записи,
+    к которым дольше всего не обращались.
+
+    Для картинок тело не хранится (оно уже лежит в папке с фото),
+    запоминаются только валидаторы ETag и Last-Modified и путь к файлу,
+    в который легла картинка: перепроверка возможна, только пока в этом
+    файле лежит именно она.
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.folder / INDEX_FILENAME, check_same_thread=False)
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                path TEXT
+            )
+        ''')
+        existing = {row[1] for row in self._db.execute('PRAGMA table_info(entries)')}
+        if 'path' not in existing:
+            self._db.execute('ALTER TABLE entries ADD COLUMN path TEXT')
+            self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Закрывает соединение с индексом"""
+        with self._lock:
+            self._db.close()
+
+    def _body_path(self, key):
+        return self.folder / f'{key}.body'
+
+    def _lookup(self, key):
+        with self._lock:
+            return self._db.execute(
+                'SELECT etag, last_modified, stored_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+
+    def _lookup_file(self, key, path):
+        with self._lock:
+            return self._db.execute(
+                'SELECT etag, last_modified, stored_at FROM entries WHERE key = ? AND path = ?', (key, str(path))
+            ).fetchone()
+
+    def _touch(self, key, revalidated=False):
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self._db.execute('UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            else:
+                self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            self._db.commit()
+
+    def _store(self, key, headers, body=None, path=None):
+        now = time.time()
+        size = 0
+        if body is not None:
+            self._body_path(key).write_bytes(body)
+            size = len(body)
+        with self._lock:
+            if path is not None:
+                self._db.execute('DELETE FROM entries WHERE path = ? AND key != ?', (str(path), key))
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (key, etag, last_modified, stored_at, accessed_at, size, path) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, headers.get('ETag'), headers.get('Last-Modified'), now, now, size, None if path is None else str(path))
+            )
+            self._db.commit()
+        if size:
+            self._evict()
+
+    def _evict(self):
+        """Удаляет давно не использованные тела, пока объём не станет меньше max_bytes"""
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._db.execute('SELECT key, size FROM entries WHERE size > 0 ORDER BY accessed_at').fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._body_path(key).unlink(missing_ok=True)
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+            self._db.commit()
+
+    @staticmethod
+    def _conditional_headers(entry):
+        headers = {}
+        if entry:
+            etag, last_modified, _ = entry
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def get(self, url, params=None, ttl=None, session=None):
+        """Выполняет GET-запрос через кэш и возвращает тело ответа.
+
+        Args:
+            url (str): Адрес запроса
+            params (dict, optional): Параметры запроса
+            ttl (int, optional): Срок свежести записи в секундах
+                (по умолчанию — ttl кэша)
+            session (requests.Session, optional): Сессия для запроса
+
+        Returns:
+            bytes: Тело ответа
+
+        Raises:
+            requests.exceptions.HTTPError: Если сервер вернул ошибку
+        """
+        ttl = self.ttl if ttl is None else ttl
+        key = cache_key(url, params)
+        body_path = self._body_path(key)
+        entry = self._lookup(key)
+        if entry and not body_path.exists():
+            entry = None
+
+        if entry and time.time() - entry[2] < ttl:
+            self.hits += 1
+            inc('http_cache_hits_total', kind='api', revalidated='no')
+            self._touch(key)
+            return body_path.read_bytes()
+
+        response = request('GET', url, session=session, params=params, headers=self._conditional_headers(entry))
+        if response.status_code == 304 and entry:
+            self.hits += 1
+            inc('http_cache_hits_total', kind='api', revalidated='yes')
+            self._touch(key, revalidated=True)
+            return body_path.read_bytes()
+
+        response.raise_for_status()
+        self.misses += 1
+        inc('http_cache_misses_total', kind='api')
+        self._store(key, response.headers, response.content)
+        return response.content
+
+    def get_json(self, url, params=None, ttl=None, session=None):
+        """То же, что get, но разбирает ответ как JSON"""
+        return json.loads(self.get(url, params=params, ttl=ttl, session=session))
+
+    def validators(self, url, path):
+        """Возвращает заголовки условного запроса для ранее скачанного URL.
+
+        Args:
+            url (str): Ссылка на картинку
+            path (Path): Файл, в который её нужно сохранить
+
+        Returns:
+            dict: Заголовки If-None-Match / If-Modified-Since или пустой
+                словарь, если в path лежит не эта картинка (или файла нет)
+        """
+        if not Path(path).exists():
+            return {}
+        return self._conditional_headers(self._lookup_file(cache_key(url), path))
+
+    def not_modified(self, url):
+        """Отмечает, что сервер подтвердил актуальность URL (ответ 304)"""
+        self.hits += 1
+        inc('http_cache_hits_total', kind='image', revalidated='yes')
+        self._touch(cache_key(url), revalidated=True)
+
+    def remember(self, url, headers, path):
+        """Запоминает валидаторы ответа для URL и файл, в который он сохранён.
+
+        Валидаторы других URL, ранее сохранённых в тот же файл, забываются.
+        """
+        if headers.get('ETag') or headers.get('Last-Modified'):
+            self.misses += 1
+            inc('http_cache_misses_total', kind='image')
+            self._store(cache_key(url), headers, path=path)
+
+
+def fetch_json(url, params=None, cache=None, ttl=None):
+    """Запрашивает JSON через кэш, а если кэш не задан — напрямую.
+
+    Args:
+        url (str): Адрес запроса
+        params (dict, optional): Параметры запроса
+        cache (HttpCache, optional): Кэш ответов
+        ttl (int, optional): Срок свежести записи в секундах
+
+    Returns:
+        Разобранный JSON-ответ
+    """
+    if cache:
+        return cache.get_json(url, params=params, ttl=ttl)
+    response = request('GET', url, params=params)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,237 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import inc, observe
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 60
+MAX_RETRIES = 5
+BACKOFF_BASE = 1
+BACKOFF_CAP = 300
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Скорость (запросов в секунду), запас запросов и окно квоты в секундах
+# для хостов с квотами. Ключ NASA даёт 1000 запросов в скользящий час.
+HOST_RATES = {
+    'api.nasa.gov': (1000 / 3600, 30, 3600),
+    'api.spacexdata.com': (10, 20, None),
+}
+
+_session = None
+_session_lock = threading.Lock()
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """Создаёт сессию requests с пулом переиспользуемых соединений.
+
+    Args:
+        pool_size (int): Максимальное число соединений к одному хосту в пуле
+
+    Returns:
+        requests.Session: Новая сессия
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Возвращает общую для всего процесса сессию requests.
+
+    Сессия создаётся при первом вызове и затем переиспользуется,
+    поэтому повторные запросы к тому же хосту не открывают новое TLS-соединение.
+
+    Returns:
+        requests.Session: Общая сессия
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов «ведро с токенами».
+
+    Ведро пополняется со скоростью rate токенов в секунду и вмещает не
+    больше capacity токенов; каждый запрос забирает один токен, а при
+    пустом ведре ждёт пополнения. Если сервер сообщил, что квота
+    исчерпана, запросы приостанавливаются до конца окна квоты window.
+    """
+
+    def __init__(self, rate, capacity, window=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.window = window
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Забирает токен, при необходимости дожидаясь его"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait_time = self._paused_until - now
+                else:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+    def limit_to(self, remaining, reset_after=None):
+        """Не даёт потратить больше запросов, чем осталось по квоте сервера.
+
+        Args:
+            remaining (int): Сколько запросов осталось по квоте
+            reset_after (float, optional): Через сколько секунд квота
+                восстановится (по умолчанию — окно квоты window)
+
+        Returns:
+            float: Пауза в секундах, если квота исчерпана и запросы только
+                что приостановлены, иначе None
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, remaining)
+            pause = reset_after if reset_after is not None else self.window
+            if remaining > 0 or not pause:
+                return None
+            now = time.monotonic()
+            if self._paused_until > now:
+                return None
+            # После паузы квота восстановлена целиком
+            self._paused_until = now + pause
+            self._updated = self._paused_until
+            self._tokens = self.capacity
+            return pause
+
+
+def get_bucket(host):
+    """Возвращает общее ведро токенов для хоста (или None, если лимита нет)"""
+    if host not in HOST_RATES:
+        return None
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(*HOST_RATES[host])
+        return _buckets[host]
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Пауза перед повтором: экспоненциальный рост со случайным разбросом.
+
+    Args:
+        attempt (int): Номер повтора, начиная с 0
+        base (float): Пауза перед первым повтором в секундах
+        cap (float): Максимальная пауза в секундах
+
+    Returns:
+        float: Пауза в секундах
+    """
+    delay = min(cap, base * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def parse_retry_after(value):
+    """Переводит заголовок Retry-After (секунды или HTTP-дата) в секунды"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def request(method, url, session=None, retries=MAX_RETRIES, **kwargs):
+    """Выполняет HTTP-запрос с повторами и учётом лимитов API.
+
+    Перед запросом берётся токен из ведра хоста (см. HOST_RATES).
+    Сетевые ошибки и ответы 429/5xx повторяются с экспоненциальной паузой
+    и случайным разбросом; если сервер прислал Retry-After, пауза не
+    короче него. Заголовок X-RateLimit-Remaining (NASA) ограничивает
+    запас токенов, чтобы не выйти за квоту, а когда он доходит до нуля,
+    запросы к хосту приостанавливаются до конца окна квоты (или на
+    Retry-After, если сервер его прислал).
+
+    Время до заголовков ответа (http_ttfb_seconds), полное время запроса,
+    объём ответов, повторы и ожидание лимита записываются в метрики.
+    Для stream=True полное время — до заголовков, тело читает вызывающий код.
+
+    Args:
+        method (str): HTTP-метод
+        url (str): Адрес запроса
+        session (requests.Session, optional): Сессия (по умолчанию — общая)
+        retries (int): Максимальное число повторов
+        **kwargs: Параметры requests (params, json, headers, stream, ...)
+
+    Returns:
+        requests.Response: Ответ сервера (в том числе с кодом ошибки,
+            если повторы закончились)
+
+    Raises:
+        requests.exceptions.RequestException: Если сетевая ошибка
+            повторилась больше retries раз
+    """
+    session = session or get_session()
+    host = urlsplit(url).netloc
+    bucket = get_bucket(host)
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    attempt = 0
+    while True:
+        if bucket:
+            waiting_since = time.perf_counter()
+            bucket.acquire()
+            inc('http_rate_limit_wait_seconds_total', time.perf_counter() - waiting_since, host=host)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            inc('http_request_errors_total', host=host, method=method, error=e.__class__.__name__)
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            inc('http_retries_total', host=host, reason='network')
+            print(f'Сетевая ошибка {url}: {e}. Повтор через {delay:.1f} с')
+        else:
+            observe('http_ttfb_seconds', response.elapsed.total_seconds(), host=host, method=method)
+            observe('http_request_seconds', time.perf_counter() - started, host=host, method=method)
+            inc('http_requests_total', host=host, method=method, status=response.status_code)
+            if not kwargs.get('stream'):
+                inc('http_response_bytes_total', len(response.content), host=host)
+            remaining = response.headers.get('X-RateLimit-Remaining')
+            if bucket and remaining is not None and remaining.isdigit():
+                pause = bucket.limit_to(int(remaining), parse_retry_after(response.headers.get('Retry-After')))
+                if pause:
+                    inc('http_rate_limit_pauses_total', host=host)
+                    print(f'Квота запросов к {host} исчерпана. Пауза {pause / 60:.0f} мин')
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            delay = max(backoff_delay(attempt), parse_retry_after(response.headers.get('Retry-After')) or 0)
+            response.close()
+            inc('http_retries_total', host=host, reason=response.status_code)
+            print(f'Ответ {response.status_code} от {host}. Повтор через {delay:.1f} с')
+        time.sleep(delay)
+        attempt += 1
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from file_utils import get_image_size
+
+INDEX_FILENAME = '.images.sqlite'
+METADATA_FIELDS = ('source', 'title', 'captured_at')
+
+
+class ImageStore:
+    """Индекс скачанных изображений по URL и хэшу содержимого.
+
+    Хранит в папке небольшую базу SQLite: какие URL уже скачаны и в какой
+    файл легло каждое уникальное содержимое (sha256). Одинаковые байты,
+    пришедшие по разным ссылкам, сохраняются на диск один раз.
+
+    Вместе с файлом запоминаются его размеры в пикселях (из заголовка),
+    а с URL — метаданные источника: откуда снимок, название и дата съёмки.
+    По этому индексу бот публикации выбирает и подписывает фото
+    (см. photo_index.py), не открывая сами файлы.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.folder / INDEX_FILENAME, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+                fetched_at REAL NOT NULL,
+                source TEXT,
+                title TEXT,
+                captured_at TEXT
+            );
+        ''')
+        self._add_columns('blobs', {'width': 'INTEGER', 'height': 'INTEGER'})
+        self._add_columns('urls', {field: 'TEXT' for field in METADATA_FIELDS})
+        self._db.executescript('''
+            CREATE INDEX IF NOT EXISTS urls_sha256 ON urls (sha256);
+            CREATE INDEX IF NOT EXISTS urls_captured_at ON urls (captured_at);
+        ''')
+
+    def _add_columns(self, table, columns):
+        """Добавляет новые столбцы в индекс, созданный прежней версией"""
+        existing = {row[1] for row in self._db.execute(f'PRAGMA table_info({table})')}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self._db.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Закрывает соединение с индексом"""
+        with self._lock:
+            self._db.close()
+
+    def has_url(self, url):
+        """Проверяет, скачивался ли уже этот URL и цел ли его файл"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT blobs.path FROM urls JOIN blobs USING (sha256) WHERE urls.url = ?', (url,)
+            ).fetchone()
+        return row is not None and (self.folder / row[0]).exists()
+
+    def save(self, url, tmp_path, sha256, size, target, metadata=None):
+        """Кладёт скачанный временный файл в хранилище.
+
+        Если такое содержимое уже есть, временный файл удаляется, а URL
+        привязывается к существующему файлу. Иначе файл переименовывается
+        в `target`, к имени которого добавляется начало хэша.
+
+        Args:
+            url (str): Откуда скачан файл
+            tmp_path (Path): Временный файл с содержимым
+            sha256 (str): Хэш содержимого
+            size (int): Размер в байтах
+            target (Path): Желаемый путь файла (без хэша в имени)
+            metadata (dict, optional): Метаданные снимка: source, title, captured_at
+
+        Returns:
+            tuple: (итоговый путь, True если файл новый / False если дубликат)
+        """
+        target = Path(target)
+        with self._lock:
+            row = self._db.execute('SELECT path FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if row and (self.folder / row[0]).exists():
+                Path(tmp_path).unlink(missing_ok=True)
+                filepath, is_new = self.folder / row[0], False
+            else:
+                width, height = get_image_size(tmp_path) or (None, None)
+                filepath = target.with_name(f'{target.stem}_{sha256[:16]}{target.suffix}')
+                os.replace(tmp_path, filepath)
+                relative = filepath.resolve().relative_to(self.folder.resolve()).as_posix()
+                self._db.execute(
+                    'INSERT OR REPLACE INTO blobs (sha256, path, size, width, height) VALUES (?, ?, ?, ?, ?)',
+                    (sha256, relative, size, width, height)
+                )
+                is_new = True
+            metadata = metadata or {}
+            self._db.execute(
+                'INSERT OR REPLACE INTO urls (url, sha256, fetched_at, source, title, captured_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (url, sha256, time.time(), *(metadata.get(field) for field in METADATA_FIELDS))
+            )
+            self._db.commit()
+        return filepath, is_new
@@ -0,0 +1,214 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FLUSH_INTERVAL = 60
+
+
+def format_labels(labels):
+    """Записывает метки в формате Prometheus: {host="api.nasa.gov",status="200"}"""
+    if not labels:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Registry:
+    """Счётчики, показатели и гистограммы процесса.
+
+    Метрика определяется именем и набором меток. Все методы можно вызывать
+    из разных потоков; запись стоит одного словарного обновления под
+    блокировкой, поэтому метрики собираются всегда, даже если их никто
+    не выгружает.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Увеличивает счётчик"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Задаёт текущее значение показателя (например, длину очереди)"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """Добавляет значение в гистограмму (обычно длительность в секундах)"""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * (len(DEFAULT_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+            histogram['buckets'][bisect_left(DEFAULT_BUCKETS, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        """Возвращает текущие значения всех метрик.
+
+        Returns:
+            list: Словари с полями name, type, labels и value
+                (для гистограмм — count, sum и buckets)
+        """
+        with self._lock:
+            series = [
+                {'name': name, 'type': 'counter', 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._counters.items()
+            ]
+            series += [
+                {'name': name, 'type': 'gauge', 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._gauges.items()
+            ]
+            series += [
+                {
+                    'name': name,
+                    'type': 'histogram',
+                    'labels': dict(labels),
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 6),
+                    'buckets': dict(zip([*map(str, DEFAULT_BUCKETS), '+Inf'], histogram['buckets'])),
+                }
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        return sorted(series, key=lambda item: (item['name'], sorted(item['labels'].items())))
+
+    def render_prometheus(self):
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        lines = []
+        described = set()
+        for item in self.snapshot():
+            name, labels = item['name'], tuple(item['labels'].items())
+            if name not in described:
+                lines.append(f"# TYPE {name} {item['type']}")
+                described.add(name)
+            if item['type'] != 'histogram':
+                lines.append(f"{name}{format_labels(labels)} {item['value']}")
+                continue
+            cumulative = 0
+            for bound, count in item['buckets'].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {item['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {item['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Увеличивает счётчик в общем реестре"""
+    REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    """Задаёт показатель в общем реестре"""
+    REGISTRY.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """Добавляет значение в гистограмму общего реестра"""
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    """Замеряет время выполнения блока и записывает его в гистограмму name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - started, **labels)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    """Выгружает метрики реестра во время работы скрипта.
+
+    Если задан port, метрики доступны по HTTP в формате Prometheus
+    (http://localhost:PORT/metrics). Если задан path, каждые interval
+    секунд и при завершении в файл дописывается строка JSON со снимком
+    всех метрик. Без port и path ничего не делает.
+    """
+
+    def __init__(self, port=None, path=None, interval=FLUSH_INTERVAL, registry=REGISTRY):
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._server = None
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """Запускает HTTP-сервер метрик и периодическую запись в файл"""
+        if self.port:
+            self._server = ThreadingHTTPServer(('', self.port), MetricsHandler)
+            self._server.daemon_threads = True
+            self._server.registry = self.registry
+            self._threads.append(threading.Thread(target=self._server.serve_forever, daemon=True))
+            print(f'Метрики доступны на http://localhost:{self.port}/metrics')
+        if self.path:
+            self._threads.append(threading.Thread(target=self._flush_periodically, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Дописывает в файл строку JSON с текущими значениями метрик"""
+        line = json.dumps({'time': round(time.time(), 3), 'metrics': self.registry.snapshot()}, ensure_ascii=False)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+    def close(self):
+        """Останавливает выгрузку; в файл записывается последний снимок"""
+        self._stopped.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.path:
+            self.flush()
@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import struct
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_PAYLOAD_SIZE = 256 * 1024
+IMAGE_WIDTH = 2048
+IMAGE_HEIGHT = 2048
+FIRST_DAY = date(2020, 1, 1)
+
+
+def make_image_header(extension, width=IMAGE_WIDTH, height=IMAGE_HEIGHT):
+    """Возвращает начало файла PNG или JPEG с правильными размерами.
+
+    Остальная часть картинки-заглушки — случайные байты: для загрузки
+    и индексации важны только размер файла и заголовок.
+    """
+    if extension == '.png':
+        ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+        chunk = b'IHDR' + ihdr
+        return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+    sof = struct.pack('>BHHB', 8, height, width, 3) + b'\x01\x11\x00\x02\x11\x01\x03\x11\x01'
+    return b'\xff\xd8' + b'\xff\xc0' + struct.pack('>H', len(sof) + 2) + sof
+
+
+class MockApiServer(ThreadingHTTPServer):
+    """Локальная замена API NASA APOD, NASA EPIC, SpaceX v5 и Telegram Bot API.
+
+    Отвечает данными того же вида, что и настоящие сервисы, а картинки
+    отдаёт заглушками заданного размера. Можно добавить задержку ответа
+    и доли ответов 500 и 429, чтобы проверить повторы и лимиты.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, payload_size=DEFAULT_PAYLOAD_SIZE, latency=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 images_per_day=10, launches=20, images_per_launch=5, seed=0):
+        super().__init__(address, MockApiHandler)
+        self.payload_size = payload_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.images_per_day = images_per_day
+        self.launches = launches
+        self.images_per_launch = images_per_launch
+        self.random = random.Random(seed)
+        self.body = random.Random(seed).randbytes(payload_size)
+        self.message_ids = itertools.count(1)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def image(self, path):
+        """Картинка-заглушка: своя для каждого пути, чтобы не считаться дубликатом"""
+        extension = '.png' if path.endswith('.png') else '.jpg'
+        header = make_image_header(extension) + hashlib.sha256(path.encode()).digest()
+        return header + self.body[len(header):]
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        server = self.server
+        body = self.read_body()
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urlsplit(self.path)
+        is_telegram = url.path.startswith('/bot')
+        roll = server.random.random()
+        if roll < server.rate_limit_rate:
+            if is_telegram:
+                error = {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1', 'parameters': {'retry_after': 1}}
+                return self.send_body(429, error)
+            return self.send_body(429, {'error': 'rate limited'}, headers={'Retry-After': '1'})
+        if roll < server.rate_limit_rate + server.error_rate:
+            if is_telegram:
+                return self.send_body(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'})
+            return self.send_body(500, {'error': 'internal error'})
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for pattern, handler in ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if match:
+                return handler(self, params, body, *match.groups())
+        self.send_body(404, {'error': 'not found'})
+
+    def image(self, params, body):
+        data = self.server.image(self.path)
+        etag = '"' + hashlib.sha1(self.path.encode()).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_body(304, b'', headers={'ETag': etag})
+        content_type = 'image/png' if self.path.endswith('.png') else 'image/jpeg'
+        self.send_body(200, data, content_type, headers={'ETag': etag, 'Accept-Ranges': 'bytes'})
+
+    def apod_item(self, day):
+        base = self.server.base_url
+        return {
+            'date': day.isoformat(),
+            'title': f'Astronomy Picture {day.isoformat()}',
+            'media_type': 'image',
+            'url': f'{base}/images/apod/{day.isoformat()}.jpg',
+            'hdurl': f'{base}/images/apod/hd/{day.isoformat()}.jpg',
+        }
+
+    def apod(self, params, body):
+        if 'start_date' in params:
+            start = date.fromisoformat(params['start_date'])
+            end = date.fromisoformat(params.get('end_date') or date.today().isoformat())
+            days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        else:
+            count = int(params.get('count', 1))
+            days = [FIRST_DAY + timedelta(days=self.server.random.randrange(3650)) for _ in range(count)]
+        self.send_body(200, [self.apod_item(day) for day in days])
+
+    def epic_day(self, params, body, collection, day=None):
+        day = date.fromisoformat(day) if day else date.today()
+        images = []
+        for index in range(self.server.images_per_day):
+            moment = datetime.combine(day, datetime.min.time()) + timedelta(minutes=index * 90)
+            images.append({
+                'image': f'epic_1b_{moment:%Y%m%d%H%M%S}',
+                'date': moment.strftime('%Y-%m-%d %H:%M:%S'),
+                'caption': 'This image was taken by NASA\'s EPIC camera',
+            })
+        self.send_body(200, images)
+
+    def launch(self, index):
+        launch_id = f'{index:024x}'
+        return {
+            'id': launch_id,
+            'name': f'Mock Launch {index}',
+            'date_utc': (datetime(2020, 1, 1) + timedelta(days=index * 7)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'links': {'flickr': {'original': [
+                f'{self.server.base_url}/images/spacex/{launch_id}/{photo}.jpg'
+                for photo in range(self.server.images_per_launch)
+            ]}},
+        }
+
+    def spacex_launch(self, params, body, launch_id):
+        index = self.server.launches - 1 if launch_id == 'latest' else int(launch_id, 16)
+        self.send_body(200, self.launch(index))
+
+    def spacex_query(self, params, body):
+        options = json.loads(body or b'{}').get('options', {})
+        page, limit = options.get('page', 1), options.get('limit', 10)
+        total = self.server.launches
+        first = (page - 1) * limit
+        docs = [self.launch(index) for index in range(first, min(first + limit, total))]
+        has_next = first + limit < total
+        self.send_body(200, {
+            'docs': docs,
+            'totalDocs': total,
+            'limit': limit,
+            'page': page,
+            'hasNextPage': has_next,
+            'nextPage': page + 1 if has_next else None,
+        })
+
+    def message(self, params):
+        message_id = next(self.server.message_ids)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': -1001, 'type': 'channel', 'title': 'Mock'},
+            'photo': [{
+                'file_id': f'mock-file-{message_id}',
+                'file_unique_id': f'mock-{message_id}',
+                'width': IMAGE_WIDTH,
+                'height': IMAGE_HEIGHT,
+            }],
+        }
+
+    def telegram(self, params, body, token, method):
+        if method == 'getMe':
+            result = {'id': int(token.split(':')[0]), 'is_bot': True, 'first_name': 'Mock', 'username': 'mock_bot'}
+        elif method == 'sendMediaGroup':
+            count = len(re.findall(rb'"type":\s*"photo"', body)) or 1
+            result = [self.message(params) for _ in range(count)]
+        else:
+            result = self.message(params)
+        self.send_body(200, {'ok': True, 'result': result})
+
+
+ROUTES = [
+    (r'/images/.+', MockApiHandler.image),
+    (r'/archive/.+\.png', MockApiHandler.image),
+    (r'/planetary/apod', MockApiHandler.apod),
+    (r'/EPIC/api/(\w+)/date/([\d-]+)', MockApiHandler.epic_day),
+    (r'/EPIC/api/(\w+)/images', MockApiHandler.epic_day),
+    (r'/v5/launches/query', MockApiHandler.spacex_query),
+    (r'/v5/launches/(\w+)', MockApiHandler.spacex_launch),
+    (r'/bot([^/]+)/(\w+)', MockApiHandler.telegram),
+]
+
+
+def serve(connection, host, port, options):
+    server = MockApiServer((host, port), **options)
+    connection.send(server.base_url)
+    connection.close()
+    server.serve_forever()
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Запускает сервер-заглушку в отдельном процессе.
+
+    Отдельный процесс не делит GIL с измеряемым кодом, поэтому сервер
+    меньше искажает замеры.
+
+    Args:
+        host (str): Адрес для прослушивания
+        port (int): Порт (0 — любой свободный)
+        **options: Параметры MockApiServer (payload_size, latency, error_rate, ...)
+
+    Returns:
+        tuple: (процесс сервера, базовый URL вида http://127.0.0.1:PORT)
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child, host, port, options), daemon=True)
+    process.start()
+    base_url = parent.recv()
+    return process, base_url
+
+
+def parse_arguments():
+    """Парсит аргументы командной строки.
+
+    Returns:
+        Namespace: Объект с аргументами командной строки
+    """
+    parser = argparse.ArgumentParser(description='Локальная замена API NASA, SpaceX и Telegram для тестов и замеров')
+    parser.add_argument('--host', default='127.0.0.1', metavar='', help='Адрес (по умолчанию: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, metavar='', help='Порт (по умолчанию: 8000)')
+    parser.add_argument('--payload_kb', type=int, default=DEFAULT_PAYLOAD_SIZE // 1024, metavar='', help='Размер картинки в КБ (по умолчанию: 256)')
+    parser.add_argument('--latency_ms', type=float, default=0, metavar='', help='Задержка каждого ответа в мс')
+    parser.add_argument('--error_rate', type=float, default=0, metavar='', help='Доля ответов 500 (от 0 до 1)')
+    parser.add_argument('--rate_limit_rate', type=float, default=0, metavar='', help='Доля ответов 429 (от 0 до 1)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    server = MockApiServer(
+        (args.host, args.port),
+        payload_size=args.payload_kb * 1024,
+        latency=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    print(f'Сервер-заглушка запущен на {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nСервер остановлен')
+
+
+if __name__ == '__main__':
+    main()
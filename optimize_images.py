@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, UnidentifiedImageError
+from file_utils import file_sha256, format_size
+from publish_queue import SUPPORTED_EXTENSIONS
+
+MAX_SIDE = 2560
+MAX_BYTES = 5 * 1024 * 1024
+QUALITY = 85
+MIN_QUALITY = 50
+FORMATS = {'jpeg': '.jpg', 'webp': '.webp'}
+
+
+def encode(image, image_format, quality):
+    """Кодирует изображение в память и возвращает байты"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.upper(), quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def fit_to_budget(image, image_format='jpeg', max_side=MAX_SIDE, max_bytes=MAX_BYTES, quality=QUALITY):
+    """Уменьшает и перекодирует изображение, пока оно не влезет в бюджет.
+
+    Сначала длинная сторона уменьшается до max_side. Если файл всё ещё
+    больше max_bytes, понижается качество (не ниже MIN_QUALITY), а затем
+    изображение уменьшается ещё.
+
+    Args:
+        image (PIL.Image.Image): Исходное изображение
+        image_format (str): 'jpeg' или 'webp'
+        max_side (int): Максимальный размер длинной стороны в пикселях
+        max_bytes (int): Максимальный размер файла в байтах
+        quality (int): Начальное качество сжатия
+
+    Returns:
+        bytes: Закодированное изображение
+    """
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    while True:
+        data = encode(image, image_format, quality)
+        if len(data) <= max_bytes:
+            return data
+        if quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - 10)
+        else:
+            image = image.resize((int(image.width * 0.8), int(image.height * 0.8)), Image.LANCZOS)
+
+
+def options_tag(max_side, max_bytes, quality):
+    """Короткий хэш параметров сжатия для имени результата"""
+    return hashlib.sha256(f'{max_side}:{max_bytes}:{quality}'.encode()).hexdigest()[:8]
+
+
+def optimize_image(source, target_folder, image_format='jpeg', max_side=MAX_SIDE, max_bytes=MAX_BYTES, quality=QUALITY):
+    """Готовит одно фото к публикации.
+
+    Результат называется по хэшу исходного файла и параметров сжатия,
+    поэтому повторный запуск с теми же параметрами находит готовый файл
+    и не перекодирует фото заново, а с другими — создаёт новый и удаляет
+    результат прежних параметров, чтобы фото не опубликовалось дважды.
+
+    Args:
+        source (Path): Исходное фото
+        target_folder (Path): Папка для результата
+        image_format (str): 'jpeg' или 'webp'
+        max_side (int): Максимальный размер длинной стороны в пикселях
+        max_bytes (int): Максимальный размер файла в байтах
+        quality (int): Начальное качество сжатия
+
+    Returns:
+        tuple: (путь к результату, размер исходника, размер результата, True если перекодировано)
+    """
+    target_folder = Path(target_folder)
+    source_hash = file_sha256(source)[:16]
+    name = f'{source_hash}_{options_tag(max_side, max_bytes, quality)}'
+    target = target_folder / f'{name}{FORMATS[image_format]}'
+    source_size = os.path.getsize(source)
+    if target.exists():
+        return target, source_size, target.stat().st_size, False
+
+    with Image.open(source) as image:
+        data = fit_to_budget(image, image_format, max_side, max_bytes, quality)
+
+    target_folder.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f'.{target.name}.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, target)
+    for stale in target_folder.glob(f'{source_hash}*'):
+        if stale != target:
+            stale.unlink(missing_ok=True)
+    return target, source_size, len(data), True
+
+
+def optimize_folder(source_dir, target_dir, workers=None, **options):
+    """Готовит к публикации все фото из папки, сохраняя структуру подпапок.
+
+    Фото обрабатываются параллельно в пуле процессов. Файл, который не
+    удалось прочитать как изображение (например, сохранённая вместо картинки
+    страница с ошибкой), учитывается как ошибка и не прерывает остальные.
+
+    Args:
+        source_dir (Path): Папка со скачанными фото
+        target_dir (Path): Папка для готовых к публикации фото
+        workers (int, optional): Количество процессов (по умолчанию — по числу ядер)
+        **options: Параметры optimize_image (image_format, max_side, max_bytes, quality)
+
+    Returns:
+        tuple: (обработано новых, взято из кэша, ошибок, байт до, байт после)
+    """
+    source_dir, target_dir = Path(source_dir), Path(target_dir)
+    jobs = []
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            path = Path(root) / file
+            if path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                jobs.append((path, target_dir / path.parent.relative_to(source_dir)))
+
+    converted = cached = failed = size_before = size_after = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(optimize_image, source, folder, **options) for source, folder in jobs]
+        for (source, _), future in zip(jobs, futures):
+            try:
+                _, source_size, target_size, is_new = future.result()
+            except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+                print(f'Не удалось обработать {source}: {e}')
+                failed += 1
+                continue
+            converted += is_new
+            cached += not is_new
+            size_before += source_size
+            size_after += target_size
+    return converted, cached, failed, size_before, size_after
+
+
+def parse_arguments():
+    """Парсит аргументы командной строки.
+
+    Returns:
+        Namespace: Объект с аргументами командной строки
+    """
+    parser = argparse.ArgumentParser(description='Подготовка фото к публикации в Telegram: уменьшение и сжатие')
+    parser.add_argument('--src', required=True, type=Path, metavar='', help='Папка со скачанными фото')
+    parser.add_argument('--dst', required=True, type=Path, metavar='', help='Папка для готовых к публикации фото')
+    parser.add_argument('--format', choices=FORMATS, default='jpeg', help='Формат результата (по умолчанию: jpeg)')
+    parser.add_argument('--max_side', type=int, default=MAX_SIDE, metavar='', help=f'Макс. длинная сторона в пикселях (по умолчанию: {MAX_SIDE})')
+    parser.add_argument('--max_mb', type=float, default=MAX_BYTES / 1024 / 1024, metavar='', help='Макс. размер файла в МБ (по умолчанию: 5)')
+    parser.add_argument('--quality', type=int, default=QUALITY, metavar='', help=f'Качество сжатия (по умолчанию: {QUALITY})')
+    parser.add_argument('-w', '--workers', type=int, default=None, metavar='', help='Количество процессов (по умолчанию — по числу ядер)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    converted, cached, failed, size_before, size_after = optimize_folder(
+        args.src,
+        args.dst,
+        workers=args.workers,
+        image_format=args.format,
+        max_side=args.max_side,
+        max_bytes=int(args.max_mb * 1024 * 1024),
+        quality=args.quality
+    )
+    print(f'Готово! Обработано: {converted}, из кэша: {cached}, ошибок: {failed}, '
+          f'объём: {format_size(size_before)} → {format_size(size_after)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from image_store import INDEX_FILENAME
+
+MAX_CAPTION_LENGTH = 1024
+DEFAULT_CAPTION = '{title}\n{date}'
+FIELDS = ('path', 'sha256', 'size', 'width', 'height', 'url', 'source', 'title', 'captured_at')
+SAMPLE_PHOTO = {'title': 'Title', 'captured_at': '2020-01-01T00:00:00', 'source': 'apod', 'width': 1, 'height': 1, 'url': 'https://example.com/photo.jpg'}
+PHOTO_QUERY = '''
+    SELECT blobs.path, blobs.sha256, blobs.size, blobs.width, blobs.height,
+           urls.url, urls.source, urls.title, MIN(urls.captured_at) AS captured_at
+    FROM blobs JOIN urls USING (sha256)
+    WHERE {conditions}
+    GROUP BY blobs.sha256
+'''
+
+
+class PhotoIndex:
+    """Метаданные скачанных фото из индексов ImageStore (.images.sqlite).
+
+    Индексы ищутся в самой папке и в её подпапках первого уровня, так что
+    подходит и папка одного скрипта загрузки, и общая папка с epic_images,
+    nasa_images и spacex_images внутри. Базы открываются только для чтения
+    при первом запросе; выбор фото — один SQL-запрос к каждой базе
+    вместо обхода и чтения файлов.
+    """
+
+    def __init__(self, directory, sources=None, since=None, min_width=None):
+        self.directory = Path(directory)
+        self.sources = sources
+        self.since = since
+        self.min_width = min_width
+        self._connections = {}
+
+    def close(self):
+        """Закрывает открытые базы"""
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+    def index_paths(self):
+        """Возвращает пути к найденным индексам"""
+        candidates = [self.directory / INDEX_FILENAME, *self.directory.glob(f'*/{INDEX_FILENAME}')]
+        return [path for path in candidates if path.is_file()]
+
+    def version(self):
+        """Отпечаток индексов: меняется, когда скрипт загрузки добавил фото"""
+        return tuple((str(path), path.stat().st_mtime_ns) for path in self.index_paths())
+
+    def _connect(self, index_path):
+        if index_path not in self._connections:
+            self._connections[index_path] = sqlite3.connect(f'file:{index_path}?mode=ro', uri=True)
+        return self._connections[index_path]
+
+    def _query(self, index_path, conditions, params):
+        try:
+            rows = self._connect(index_path).execute(PHOTO_QUERY.format(conditions=conditions), params).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f'Индекс {index_path} не прочитан ({e}). Запустите скрипт загрузки, чтобы обновить его')
+            return []
+        folder = index_path.parent
+        photos = []
+        for row in rows:
+            photo = dict(zip(FIELDS, row))
+            photo['path'] = folder / photo['path']
+            photos.append(photo)
+        return photos
+
+    def photos(self):
+        """Возвращает фото, подходящие под фильтры, по порядку даты съёмки.
+
+        Returns:
+            list: Словари с полями path, sha256, size, width, height,
+                url, source, title и captured_at
+        """
+        conditions, params = ['1'], []
+        if self.sources:
+            conditions.append(f"urls.source IN ({', '.join('?' * len(self.sources))})")
+            params.extend(self.sources)
+        if self.since:
+            conditions.append('urls.captured_at >= ?')
+            params.append(self.since.isoformat())
+        if self.min_width:
+            conditions.append('blobs.width >= ?')
+            params.append(self.min_width)
+
+        photos = []
+        for index_path in self.index_paths():
+            photos.extend(self._query(index_path, ' AND '.join(conditions), params))
+        return sorted(photos, key=lambda photo: (photo['captured_at'] is None, photo['captured_at'] or '', str(photo['path'])))
+
+    def lookup(self, photo_path):
+        """Возвращает метаданные одного фото (или None, если его нет в индексах)"""
+        photo_path = Path(photo_path)
+        for index_path in self.index_paths():
+            try:
+                relative = photo_path.relative_to(index_path.parent).as_posix()
+            except ValueError:
+                continue
+            photos = self._query(index_path, 'blobs.path = ?', [relative])
+            if photos:
+                return photos[0]
+        return None
+
+
+def capture_rank(photo):
+    """Ключ порядка публикации: время съёмки, фото без даты — в конце"""
+    captured_at = photo.get('captured_at')
+    if not captured_at:
+        return float('inf')
+    try:
+        return datetime.fromisoformat(captured_at[:19]).timestamp()
+    except ValueError:
+        return float('inf')
+
+
+def format_caption(template, photo):
+    """Подставляет метаданные фото в шаблон подписи.
+
+    В шаблоне доступны {title}, {date}, {source}, {width}, {height} и {url};
+    неизвестные поля заменяются пустой строкой.
+
+    Args:
+        template (str): Шаблон подписи (None — DEFAULT_CAPTION)
+        photo (dict): Метаданные из PhotoIndex (или None)
+
+    Returns:
+        str: Подпись или None, если она получилась пустой
+    """
+    photo = photo or {}
+    fields = defaultdict(str, {
+        key: value for key, value in {
+            'title': photo.get('title'),
+            'date': (photo.get('captured_at') or '')[:10],
+            'source': photo.get('source'),
+            'width': photo.get('width'),
+            'height': photo.get('height'),
+            'url': photo.get('url'),
+        }.items() if value is not None
+    })
+    caption = (template or DEFAULT_CAPTION).format_map(fields).strip()
+    return caption[:MAX_CAPTION_LENGTH] or None
+
+
+def check_caption_template(template):
+    """Проверяет шаблон подписи до начала публикации.
+
+    Шаблон пробуется на фото со всеми полями и на фото без метаданных,
+    чтобы ошибка в нём не остановила публикацию на первом же фото.
+
+    Args:
+        template (str): Шаблон подписи
+
+    Raises:
+        ValueError: Если в шаблоне непарная скобка, неизвестный формат
+            поля или обращение к атрибуту или позиционному полю
+    """
+    for photo in (SAMPLE_PHOTO, None):
+        try:
+            format_caption(template, photo)
+        except (ValueError, IndexError, KeyError, AttributeError, TypeError) as e:
+            raise ValueError(f'Неверный шаблон подписи {template!r}: {e}') from None
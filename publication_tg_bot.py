@@ -1,71 +1,271 @@
 import argparse
 import os
-import time
-import random
+from contextlib import ExitStack
+from datetime import date
 from pathlib import Path
+import requests
+import telegram
 from dotenv import load_dotenv
-from tg_bot import send_photo
+from tg_bot import send_photo, send_album, PhotoRejectedError, MAX_ALBUM_SIZE, MAX_PHOTO_SIZE, MAX_UPLOAD_SIZE
+from publish_queue import PublishQueue
+from file_id_cache import FileIdCache
+from file_utils import format_size
+from http_client import backoff_delay
+from metrics import MetricsExporter, inc, set_gauge
+from publish_scheduler import Channel, PublishScheduler, load_channels
+from photo_index import PhotoIndex, format_caption
 
-SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
+EMPTY_RETRY_DELAY = 300
+CHAT_ERROR_DELAY = 3600
 
 
-def collect_photos(directory: str) -> list:
-    """Собирает все фотографии из директории и поддиректорий"""
-    photos = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = Path(root) / file
-            if file_path.suffix.lower() in SUPPORTED_EXTENSIONS:
-                photos.append(file_path)
-    return photos
+def get_size(path):
+    """Размер файла в байтах (0, если файл не прочитать — это выяснится при отправке)"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def next_publishable_batch(queue, limit, chat_id):
+    """Берёт из очереди следующие фото, которые Telegram сможет принять.
+
+    Фото больше MAX_PHOTO_SIZE убираются из очереди: Telegram их не примет,
+    их нужно сначала уменьшить (optimize_images.py). Альбом сокращается так,
+    чтобы весь запрос уложился в MAX_UPLOAD_SIZE.
+
+    Returns:
+        list: Пути к фото (пустой, если фотографий нет)
+    """
+    while True:
+        batch = queue.next_batch(limit)
+        sizes = [get_size(path) for path in batch]
+        oversized = [path for path, size in zip(batch, sizes) if size > MAX_PHOTO_SIZE]
+        if not oversized:
+            break
+        for path in oversized:
+            print(f"Фото {path} больше {format_size(MAX_PHOTO_SIZE)} и убрано из очереди. Уменьшите его с помощью optimize_images.py")
+            queue.discard(path)
+        inc('publish_total', len(oversized), chat_id=chat_id, result='too_large')
+
+    while len(batch) > 1 and sum(sizes) > MAX_UPLOAD_SIZE:
+        batch.pop()
+        sizes.pop()
+    return batch
+
+
+def publish_batch(queue, token, chat_id, caption=None, album=False, file_ids=None, index=None):
+    """Публикует следующее фото (или альбом) из очереди.
+
+    Ошибки сети и превышение лимита Telegram передаются вызывающему коду,
+    чтобы он повторил отправку. Фото, которое не удалось прочитать
+    (файл удалён или нет прав на чтение) или которое Telegram не принял
+    (слишком большое, неверные размеры), убирается из очереди.
+
+    Args:
+        queue (PublishQueue): Очередь публикации
+        token (str): Токен бота
+        chat_id (str): ID чата
+        caption (str, optional): Подпись
+        album (bool): Публиковать альбомом до MAX_ALBUM_SIZE фото из одной папки
+        file_ids (FileIdCache, optional): Кэш file_id уже загруженных фото
+        index (PhotoIndex, optional): Индекс скачанных фото. С ним caption —
+            шаблон подписи с полями {title}, {date}, {source} и т. д.
+
+    Returns:
+        bool: False, если публиковать нечего
+
+    Raises:
+        telegram.error.RetryAfter: Если Telegram просит подождать
+        telegram.error.NetworkError, requests.exceptions.RequestException:
+            При сетевой ошибке
+        PermissionError: Если бот заблокирован в чате или исключён из него
+        ValueError, RuntimeError: Если чат не найден или Telegram отклонил запрос
+    """
+    set_gauge('publish_queue_pending', queue.refresh(), chat_id=chat_id)
+    batch = next_publishable_batch(queue, MAX_ALBUM_SIZE if album else 1, chat_id)
+    if not batch:
+        return False
+    photo_path = batch[0] if len(batch) == 1 else batch[0].parent
+    if index:
+        caption = format_caption(caption, index.lookup(batch[0]))
+
+    try:
+        if len(batch) == 1:
+            send_photo(
+                token=token,
+                chat_id=chat_id,
+                photo_path=str(photo_path),
+                caption=caption,
+                file_ids=file_ids
+                )
+        else:
+            send_album(
+                token=token,
+                chat_id=chat_id,
+                photo_paths=[str(path) for path in batch],
+                caption=caption,
+                file_ids=file_ids
+                )
+        for path in batch:
+            queue.mark_sent(path)
+        inc('publish_total', len(batch), chat_id=chat_id, result='sent')
+        print(f"Успешно опубликовано в {chat_id}: {photo_path} ({len(batch)} фото)")
+    except (telegram.error.RetryAfter, ConnectionError, requests.exceptions.RequestException, telegram.error.NetworkError):
+        raise
+    except OSError as e:
+        unreadable = [path for path in batch if not os.access(path, os.R_OK)]
+        if not unreadable:
+            raise
+        print(f"Ошибка доступа к файлу {photo_path}: {e}")
+        inc('publish_total', len(unreadable), chat_id=chat_id, result='file_error')
+        for path in unreadable:
+            queue.discard(path)
+    except PhotoRejectedError as e:
+        print(f"{e}. {photo_path} убрано из очереди")
+        inc('publish_total', len(batch), chat_id=chat_id, result='rejected')
+        for path in batch:
+            queue.discard(path)
+    except telegram.error.TelegramError as e:
+        print(f"Ошибка Telegram API ({e.__class__.__name__}): {e}")
+        inc('publish_total', len(batch), chat_id=chat_id, result='telegram_error')
+    except (ValueError, RuntimeError, TypeError) as e:
+        print(f"Ошибка выполнения при отправке {photo_path}: {e}")
+        raise
+    return True
+
+
+def run_channels(token, channels):
+    """Публикует фото в несколько чатов по их расписаниям.
+
+    Все чаты обслуживаются одним процессом: PublishScheduler выдаёт чат,
+    срок публикации которого наступил. У каждого чата своя очередь, а время
+    последней публикации сохраняется в ней, так что после перезапуска
+    расписание продолжается, а пропущенный слот публикуется один раз сразу.
+
+    Ошибка одного чата (чат не найден, бот заблокирован, Telegram отклонил
+    запрос) не останавливает остальные: публикация в этот чат повторяется
+    с растущей паузой до CHAT_ERROR_DELAY секунд.
+
+    Args:
+        token (str): Токен бота
+        channels (list): Объекты Channel
+    """
+    scheduler = PublishScheduler()
+    with ExitStack() as stack:
+        file_ids = stack.enter_context(FileIdCache())
+        queues = {}
+        indexes = {}
+        for channel in channels:
+            index = None
+            if channel.from_index:
+                index = PhotoIndex(channel.directory, channel.sources, channel.since, channel.min_width)
+                stack.callback(index.close)
+            indexes[channel] = index
+            queue = stack.enter_context(PublishQueue(channel.directory, state_path=channel.state_path, shuffle=channel.shuffle, index=index))
+            queues[channel] = queue
+            scheduler.add(channel, queue.last_fire())
+
+        while True:
+            try:
+                channel = scheduler.wait()
+                try:
+                    published = publish_batch(
+                        queues[channel],
+                        token=token,
+                        chat_id=channel.chat_id,
+                        caption=channel.caption,
+                        album=channel.album,
+                        file_ids=file_ids,
+                        index=indexes[channel]
+                        )
+                except telegram.error.RetryAfter as e:
+                    print(f"Превышен лимит запросов Telegram. Повтор через {e.retry_after} с")
+                    inc('publish_retries_total', chat_id=channel.chat_id, reason='rate_limit')
+                    scheduler.retry(channel, e.retry_after)
+                    continue
+                except (ConnectionError, requests.exceptions.RequestException, telegram.error.NetworkError) as e:
+                    delay = backoff_delay(channel.failures)
+                    channel.failures += 1
+                    print(f"Сетевая ошибка при отправке в {channel.chat_id}: {e}. Повтор через {delay:.0f} с")
+                    inc('publish_retries_total', chat_id=channel.chat_id, reason='network')
+                    scheduler.retry(channel, delay)
+                    continue
+                except (ValueError, RuntimeError, PermissionError) as e:
+                    delay = backoff_delay(channel.failures, cap=CHAT_ERROR_DELAY)
+                    channel.failures += 1
+                    if isinstance(e, PermissionError):
+                        print(f"Нет доступа к чату {channel.chat_id}: {e}")
+                    print(f"Публикация в {channel.chat_id} отложена, повтор через {delay:.0f} с")
+                    inc('publish_retries_total', chat_id=channel.chat_id, reason='chat_error')
+                    scheduler.retry(channel, delay)
+                    continue
+                except (OSError, FileNotFoundError) as e:
+                    delay = backoff_delay(channel.failures)
+                    channel.failures += 1
+                    print(f"Ошибка доступа к директории: {e}. Повтор через {delay:.0f} с")
+                    inc('publish_retries_total', chat_id=channel.chat_id, reason='directory')
+                    scheduler.retry(channel, delay)
+                    continue
+
+                channel.failures = 0
+                if not published:
+                    print(f"Фотографии для {channel.chat_id} не найдены. Повторная проверка через 5 минут")
+                    scheduler.retry(channel, EMPTY_RETRY_DELAY)
+                    continue
+                queues[channel].set_last_fire(scheduler.done(channel))
+
+            except KeyboardInterrupt:
+                print("\nРабота приложения прервана пользователем")
+                break
 
 
 def publish_photos(
         directory: Path,
-        interval_hours: int,
+        interval_hours: float,
         token: str,
         chat_id: str,
         caption: str = None,
-        shuffle: bool = False
+        shuffle: bool = False,
+        state_path: Path = None,
+        album: bool = False,
+        slots: str = None,
+        from_index: bool = False,
+        sources: list = None,
+        since: date = None,
+        min_width: int = None
         ):
-    """Основной цикл публикации фотографий"""
-    while True:
-        try:
-            photos = collect_photos(directory)
-            if shuffle:
-                random.shuffle(photos)
+    """Основной цикл публикации фотографий в один чат
 
-            for photo_path in photos:
-                try:
-                    send_photo(
-                        token=token,
-                        chat_id=chat_id,
-                        photo_path=str(photo_path),
-                        caption=caption
-                        )
-                    print(f"Успешно опубликовано: {photo_path}")
-                except (ConnectionError, requests.exceptions.RequestException) as e:
-                    print(f"Сетевая ошибка при отправке {photo_path}: {e}")
-                    time.sleep(300)
-                except (IOError, OSError, FileNotFoundError) as e:
-                    print(f"Ошибка доступа к файлу {photo_path}: {e}")
-                except telegram.error.TelegramError as e:
-                    print(f"Ошибка Telegram API ({e.__class__.__name__}): {e}")
-                    if "retry after" in str(e).lower():
-                        sleep_time = int(e.retry_after) if hasattr(e, 'retry_after') else 60
-                        time.sleep(sleep_time)
-                except (ValueError, RuntimeError, TypeError) as e:
-                    print(f"Ошибка выполнения при отправке {photo_path}: {e}")
-                    raise
-
-                time.sleep(interval_hours * 3600)
-
-        except (OSError, FileNotFoundError) as e:
-            print(f"Ошибка доступа к директории: {e}. Перезапуск через 5 минут")
-            time.sleep(300)
-        except KeyboardInterrupt:
-            print("\nРабота приложения прервана пользователем")
-            break
+    Фото берутся из постоянной очереди: новые файлы добавляются в неё по мере
+    появления, а отправленные отмечаются, так что после перезапуска
+    публикация продолжается с того же места.
+
+    Публикации идут раз в interval_hours часов или в слоты slots
+    ("09:00,18:30") без накопления сдвига от времени отправки и повторов.
+
+    В режиме album до MAX_ALBUM_SIZE фото из одной папки отправляются
+    одним альбомом за один запрос. Уже загружавшиеся фото отправляются
+    по file_id без повторной загрузки файла.
+
+    С from_index фото берутся из индекса скачанных фото (.images.sqlite)
+    по порядку даты съёмки и подписываются названием и датой снимка.
+    """
+    channel = Channel(
+        chat_id=chat_id,
+        directory=directory,
+        interval_hours=interval_hours,
+        slots=slots,
+        caption=caption,
+        shuffle=shuffle,
+        album=album,
+        state_path=state_path,
+        from_index=from_index,
+        sources=sources,
+        since=since,
+        min_width=min_width
+    )
+    run_channels(token, [channel])
 
 
 def parse_arguments(default_token=None, default_chat_id=None):
@@ -81,10 +281,20 @@ def parse_arguments(default_token=None, default_chat_id=None):
     parser = argparse.ArgumentParser(description='Автоматическая публикация фотографий в Telegram')
     parser.add_argument('--token', default=default_token, metavar='', help='Telegram Bot Token (или укажите в TG_BOT_TOKEN в .env)')
     parser.add_argument('--chat_id', default=default_chat_id, metavar='', help='ID группы/чата (или укажите в TG_GROUP_CHAT_ID в .env)')
-    parser.add_argument('--dir', required=True, type=Path, metavar='Путь', help='Обязательный путь к директории с фотографиями')
-    parser.add_argument('--interval', type=int, default=4, metavar='', help='Интервал публикации в часах (по умолчанию: 4)')
-    parser.add_argument('--caption', metavar='', help='Подпись для фотографий')
+    parser.add_argument('--dir', type=Path, metavar='Путь', help='Путь к директории с фотографиями (обязателен без --channels)')
+    parser.add_argument('--interval', type=float, default=4, metavar='', help='Интервал публикации в часах (по умолчанию: 4)')
+    parser.add_argument('--slots', metavar='', help='Публиковать каждый день в заданное время вместо интервала, например "09:00,18:30"')
+    parser.add_argument('--channels', type=Path, metavar='', help='JSON-файл с несколькими чатами и их расписаниями')
+    parser.add_argument('--caption', metavar='', help='Подпись для фотографий (с --from_index — шаблон, например "{title} ({date})")')
     parser.add_argument('--shuffle', action='store_true', help='Перемешивать фотографии перед отправкой')
+    parser.add_argument('--album', action='store_true', help=f'Публиковать фото из одной папки альбомами до {MAX_ALBUM_SIZE} штук')
+    parser.add_argument('--state', type=Path, metavar='', help='Файл состояния очереди (по умолчанию: .publish_queue.sqlite в папке с фото)')
+    parser.add_argument('--from_index', action='store_true', help='Выбирать и подписывать фото по индексу скачанных фото (.images.sqlite)')
+    parser.add_argument('--source', nargs='+', choices=('apod', 'epic', 'spacex'), metavar='', help='С --from_index: только фото из этих источников (apod, epic, spacex)')
+    parser.add_argument('--since', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД', help='С --from_index: только снимки не раньше этой даты')
+    parser.add_argument('--min_width', type=int, metavar='', help='С --from_index: только фото не уже этой ширины в пикселях')
+    parser.add_argument('--metrics_port', type=int, metavar='', help='Отдавать метрики в формате Prometheus на этом порту')
+    parser.add_argument('--metrics_file', type=Path, metavar='', help='Дописывать снимки метрик в этот файл (JSON Lines)')
     return parser.parse_args()
 
 
@@ -94,14 +304,32 @@ def main():
     env_chat_id = os.getenv('GROUP_CHAT_ID')
     args = parse_arguments(default_token=env_token, default_chat_id=env_chat_id)
 
-    publish_photos(
-        directory=args.dir,
-        interval_hours=args.interval,
-        caption=args.caption,
-        shuffle=args.shuffle,
-        token=args.token,
-        chat_id=args.chat_id
-    )
+    if not args.channels and not args.dir:
+        raise SystemExit('Укажите --dir или --channels')
+
+    try:
+        if args.channels:
+            channels = load_channels(args.channels)
+        else:
+            channels = [Channel(
+                chat_id=args.chat_id,
+                directory=args.dir,
+                interval_hours=args.interval,
+                slots=args.slots,
+                caption=args.caption,
+                shuffle=args.shuffle,
+                album=args.album,
+                state_path=args.state,
+                from_index=args.from_index,
+                sources=args.source,
+                since=args.since,
+                min_width=args.min_width
+            )]
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    with MetricsExporter(port=args.metrics_port, path=args.metrics_file):
+        run_channels(args.token, channels)
 
 
 if __name__ == '__main__':
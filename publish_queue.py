@@ -0,0 +1,268 @@
+import os
+import random
+import sqlite3
+import time
+from pathlib import Path
+from photo_index import capture_rank
+
+SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+STATE_FILENAME = '.publish_queue.sqlite'
+
+
+class PublishQueue:
+    """Постоянная очередь публикации фотографий из директории.
+
+    Состояние хранится в SQLite: какие фото найдены, в каком порядке их
+    публиковать и какие уже отправлены. После перезапуска публикация
+    продолжается с того места, где остановилась.
+
+    Новые файлы подхватываются инкрементально: содержимое папки читается
+    заново, только если изменилось её mtime (оно меняется при добавлении,
+    удалении и переименовании файлов). Неизменившиеся папки стоят одного stat.
+
+    Убранные из очереди фото (нечитаемые или отклонённые Telegram)
+    запоминаются вместе с размером и mtime файла и не возвращаются при
+    следующем обходе папки, пока сам файл не изменится.
+
+    Если передан index (PhotoIndex), очередь строится по индексу
+    скачанных фото, а не по файлам: публикуются только фото, подходящие
+    под фильтры индекса, по порядку даты съёмки. Индекс перечитывается,
+    только когда скрипт загрузки его изменил.
+    """
+
+    def __init__(self, directory, state_path=None, shuffle=False, index=None):
+        self.directory = Path(directory)
+        self.shuffle = shuffle
+        self.index = index
+        self._index_version = None
+        state_path = state_path or self.directory / STATE_FILENAME
+        self._db = sqlite3.connect(state_path)
+        # В режиме WAL запись не создаёт и не удаляет журнал при каждой
+        # фиксации, поэтому собственные записи очереди не меняют mtime
+        # папки с фото, где по умолчанию лежит файл состояния.
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS photos (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                rank REAL NOT NULL,
+                sent_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS discarded (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS schedule (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Закрывает соединение с файлом состояния"""
+        self._db.close()
+
+    def _rank(self):
+        return random.random() if self.shuffle else 0.0
+
+    def _forget_folder(self, folder):
+        pattern = folder.rstrip(os.sep) + os.sep + '%'
+        self._db.execute('DELETE FROM photos WHERE folder = ? OR folder LIKE ?', (folder, pattern))
+        self._db.execute('DELETE FROM discarded WHERE folder = ? OR folder LIKE ?', (folder, pattern))
+        self._db.execute('DELETE FROM folders WHERE path = ? OR path LIKE ?', (folder, pattern))
+
+    def _skip_discarded(self, paths, discarded):
+        """Отбрасывает новые пути, которые раньше убраны из очереди и с тех пор не менялись.
+
+        Args:
+            paths: Пути, которых ещё нет в очереди
+            discarded (dict): Путь -> (размер, mtime_ns) убранных фото
+
+        Returns:
+            list: Пути, которые нужно добавить в очередь
+        """
+        added = []
+        for path in paths:
+            if path in discarded:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) == discarded[path]:
+                    continue
+                self._db.execute('DELETE FROM discarded WHERE path = ?', (path,))
+            added.append(path)
+        return added
+
+    def _rescan_folder(self, folder, parent, mtime_ns):
+        """Перечитывает содержимое одной папки и возвращает её подпапки"""
+        subfolders = []
+        found = set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                elif Path(entry.name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                    found.add(entry.path)
+
+        known = {row[0] for row in self._db.execute('SELECT path FROM photos WHERE folder = ?', (folder,))}
+        discarded = {
+            path: (size, mtime)
+            for path, size, mtime in self._db.execute('SELECT path, size, mtime_ns FROM discarded WHERE folder = ?', (folder,))
+        }
+        self._db.executemany(
+            'INSERT INTO photos (path, folder, rank) VALUES (?, ?, ?)',
+            [(path, folder, self._rank()) for path in self._skip_discarded(found - known, discarded)]
+        )
+        self._db.executemany('DELETE FROM photos WHERE path = ?', [(path,) for path in known - found])
+        self._db.executemany('DELETE FROM discarded WHERE path = ?', [(path,) for path in discarded.keys() - found])
+
+        known_subfolders = {row[0] for row in self._db.execute('SELECT path FROM folders WHERE parent = ?', (folder,))}
+        for removed in known_subfolders - set(subfolders):
+            self._forget_folder(removed)
+
+        self._db.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?)', (folder, parent, mtime_ns))
+        return subfolders
+
+    def _sync_index(self):
+        """Приводит очередь в соответствие с индексом скачанных фото"""
+        version = self.index.version()
+        if version == self._index_version:
+            return
+        photos = {str(photo['path']): photo for photo in self.index.photos()}
+        known = {row[0] for row in self._db.execute('SELECT path FROM photos')}
+        discarded = {path: (size, mtime) for path, size, mtime in self._db.execute('SELECT path, size, mtime_ns FROM discarded')}
+        self._db.executemany(
+            'INSERT INTO photos (path, folder, rank) VALUES (?, ?, ?)',
+            [
+                (path, str(photos[path]['path'].parent), random.random() if self.shuffle else capture_rank(photos[path]))
+                for path in self._skip_discarded(photos.keys() - known, discarded)
+            ]
+        )
+        self._db.executemany('DELETE FROM photos WHERE path = ?', [(path,) for path in known - photos.keys()])
+        self._db.executemany('DELETE FROM discarded WHERE path = ?', [(path,) for path in discarded.keys() - photos.keys()])
+        self._index_version = version
+
+    def refresh(self):
+        """Добавляет в очередь новые фото и убирает удалённые.
+
+        Returns:
+            int: Количество фото в очереди, ожидающих публикации
+        """
+        if self.index:
+            self._sync_index()
+            self._db.commit()
+            return self.pending()
+
+        stack = [(str(self.directory), None)]
+        while stack:
+            folder, parent = stack.pop()
+            try:
+                mtime_ns = os.stat(folder).st_mtime_ns
+            except FileNotFoundError:
+                self._forget_folder(folder)
+                continue
+
+            row = self._db.execute('SELECT mtime_ns FROM folders WHERE path = ?', (folder,)).fetchone()
+            if row and row[0] == mtime_ns:
+                subfolders = [r[0] for r in self._db.execute('SELECT path FROM folders WHERE parent = ?', (folder,))]
+            else:
+                subfolders = self._rescan_folder(folder, parent, mtime_ns)
+            stack.extend((subfolder, folder) for subfolder in subfolders)
+
+        self._db.commit()
+        return self.pending()
+
+    def pending(self):
+        """Возвращает количество ещё не опубликованных фото"""
+        return self._db.execute('SELECT COUNT(*) FROM photos WHERE sent_at IS NULL').fetchone()[0]
+
+    def _start_new_round(self):
+        """Когда всё опубликовано, начинает новый круг по тем же фото"""
+        if self.shuffle:
+            paths = [row[0] for row in self._db.execute('SELECT path FROM photos')]
+            self._db.executemany('UPDATE photos SET rank = ? WHERE path = ?', [(random.random(), path) for path in paths])
+        self._db.execute('UPDATE photos SET sent_at = NULL')
+        self._db.commit()
+
+    def next(self):
+        """Возвращает путь к следующему фото для публикации.
+
+        Returns:
+            Path: Путь к фото или None, если фотографий нет
+        """
+        batch = self.next_batch(1)
+        return batch[0] if batch else None
+
+    def next_batch(self, limit):
+        """Возвращает следующие фото для публикации одним альбомом.
+
+        Первое фото берётся по порядку очереди, остальные — ещё не
+        опубликованные фото из той же папки (один запуск, одна дата).
+
+        Args:
+            limit (int): Максимальное количество фото
+
+        Returns:
+            list: Пути к фото (пустой, если фотографий нет)
+        """
+        query = 'SELECT path, folder FROM photos WHERE sent_at IS NULL ORDER BY rank, path LIMIT 1'
+        row = self._db.execute(query).fetchone()
+        if row is None:
+            self._start_new_round()
+            row = self._db.execute(query).fetchone()
+        if row is None:
+            return []
+
+        first, folder = row
+        rows = self._db.execute(
+            'SELECT path FROM photos WHERE sent_at IS NULL AND folder = ? AND path != ? ORDER BY rank, path LIMIT ?',
+            (folder, first, limit - 1)
+        ).fetchall()
+        return [Path(first)] + [Path(path) for path, in rows]
+
+    def mark_sent(self, photo_path):
+        """Отмечает фото как опубликованное"""
+        self._db.execute('UPDATE photos SET sent_at = ? WHERE path = ?', (time.time(), str(photo_path)))
+        self._db.commit()
+
+    def discard(self, photo_path):
+        """Убирает из очереди фото, которое не удалось прочитать или отправить.
+
+        Пока файл не изменится, при обходе папки оно не вернётся в очередь.
+        """
+        path = str(photo_path)
+        self._db.execute('DELETE FROM photos WHERE path = ?', (path,))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat:
+            self._db.execute(
+                'INSERT OR REPLACE INTO discarded VALUES (?, ?, ?, ?)',
+                (path, os.path.dirname(path), stat.st_size, stat.st_mtime_ns)
+            )
+        self._db.commit()
+
+    def last_fire(self):
+        """Возвращает время последней публикации по расписанию (или None)"""
+        row = self._db.execute("SELECT value FROM schedule WHERE key = 'last_fire'").fetchone()
+        return row[0] if row else None
+
+    def set_last_fire(self, timestamp):
+        """Запоминает время последней публикации, чтобы пережить перезапуск"""
+        self._db.execute("INSERT OR REPLACE INTO schedule VALUES ('last_fire', ?)", (timestamp,))
+        self._db.commit()
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import json
+import re
+import time
+from datetime import date, datetime, time as day_time, timedelta
+from pathlib import Path
+from metrics import observe
+from photo_index import check_caption_template
+
+SLOT_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+
+def parse_slots(value):
+    """Разбирает слоты публикации вида "09:00,18:30".
+
+    Args:
+        value (str | list): Строка со временем через запятую или список строк
+
+    Returns:
+        list: Отсортированные пары (час, минута)
+
+    Raises:
+        ValueError: Если время записано неверно
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    slots = set()
+    for item in value:
+        match = SLOT_PATTERN.match(item.strip())
+        if not match:
+            raise ValueError(f'Неверный слот публикации: {item!r} (ожидается ЧЧ:ММ)')
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            raise ValueError(f'Неверный слот публикации: {item!r}')
+        slots.add((hour, minute))
+    if not slots:
+        raise ValueError('Не задано ни одного слота публикации')
+    return sorted(slots)
+
+
+def next_slot_time(slots, after):
+    """Возвращает ближайший слот строго позже момента after.
+
+    Слоты задаются по местному времени и повторяются каждый день.
+
+    Args:
+        slots (list): Пары (час, минута), отсортированные по времени
+        after (float): Момент отсчёта (Unix time)
+
+    Returns:
+        float: Время слота (Unix time)
+    """
+    moment = datetime.fromtimestamp(after)
+    for day_offset in range(2):
+        day = moment.date() + timedelta(days=day_offset)
+        for hour, minute in slots:
+            slot = datetime.combine(day, day_time(hour, minute)).timestamp()
+            if slot > after:
+                return slot
+    raise AssertionError('Слот не найден')
+
+
+class Channel:
+    """Чат для публикации и его расписание.
+
+    Публиковать можно раз в interval_hours часов или в заданные слоты
+    по местному времени (например, каждый день в 09:00 и 18:30).
+
+    С from_index фото выбираются по индексу скачанных фото (см. PhotoIndex)
+    с фильтрами sources, since и min_width, а caption служит шаблоном подписи.
+    """
+
+    def __init__(self, chat_id, directory, interval_hours=None, slots=None, caption=None, shuffle=False, album=False, state_path=None,
+                 from_index=False, sources=None, since=None, min_width=None):
+        if not interval_hours and not slots:
+            raise ValueError(f'Для чата {chat_id} не задан ни интервал, ни слоты публикации')
+        if from_index and caption:
+            check_caption_template(caption)
+        self.chat_id = chat_id
+        self.directory = Path(directory)
+        self.interval = interval_hours * 3600 if interval_hours else None
+        self.slots = parse_slots(slots) if slots else None
+        self.caption = caption
+        self.shuffle = shuffle
+        self.album = album
+        self.state_path = Path(state_path) if state_path else None
+        self.from_index = from_index
+        self.sources = sources
+        self.since = since
+        self.min_width = min_width
+        self.failures = 0
+
+    def next_after(self, timestamp):
+        """Возвращает время следующей публикации после timestamp (Unix time)"""
+        if self.slots:
+            return next_slot_time(self.slots, timestamp)
+        return timestamp + self.interval
+
+
+def load_channels(path):
+    """Читает список чатов из JSON-файла.
+
+    Файл содержит список объектов с полями chat_id, dir и interval (часы)
+    или slots (["09:00", "18:30"]), а также необязательными caption,
+    shuffle, album, state и настройками выбора по индексу from_index,
+    sources, since ("ГГГГ-ММ-ДД") и min_width. Если state не указан, очередь каждого чата
+    хранится в отдельном файле в папке с фото, поэтому несколько чатов
+    могут публиковать одну и ту же папку независимо.
+
+    Args:
+        path (Path): Путь к JSON-файлу
+
+    Returns:
+        list: Объекты Channel
+
+    Raises:
+        ValueError: Если у чата неверное расписание или шаблон подписи
+    """
+    with open(path, encoding='utf-8') as file:
+        config = json.load(file)
+
+    channels = []
+    for item in config:
+        directory = Path(item['dir'])
+        state_path = item.get('state')
+        if not state_path:
+            safe_chat_id = re.sub(r'[^\w-]', '_', str(item['chat_id']))
+            state_path = directory / f'.publish_queue.{safe_chat_id}.sqlite'
+        channels.append(Channel(
+            chat_id=item['chat_id'],
+            directory=directory,
+            interval_hours=item.get('interval'),
+            slots=item.get('slots'),
+            caption=item.get('caption'),
+            shuffle=item.get('shuffle', False),
+            album=item.get('album', False),
+            state_path=state_path,
+            from_index=item.get('from_index', False),
+            sources=item.get('sources'),
+            since=date.fromisoformat(item['since']) if item.get('since') else None,
+            min_width=item.get('min_width')
+        ))
+    return channels
+
+
+class PublishScheduler:
+    """Расписание публикаций для нескольких чатов в одном процессе.
+
+    Ближайшие публикации хранятся в куче по сроку. Сроки отсчитываются по
+    монотонным часам и сдвигаются на интервал от предыдущего срока, а не от
+    момента окончания отправки, поэтому время отправки, повторы и ожидание
+    после ошибок не накапливают сдвиг расписания.
+
+    Пропущенные слоты (пока процесс не работал или отправка затянулась)
+    не навёрстываются по одному: вместо них делается одна публикация сразу.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._deadlines = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _push(self, channel, deadline):
+        heapq.heappush(self._heap, (deadline, next(self._order), channel))
+
+    def add(self, channel, last_fire=None):
+        """Добавляет чат в расписание.
+
+        Args:
+            channel (Channel): Чат
+            last_fire (float, optional): Время последней публикации (Unix time),
+                сохранённое до перезапуска. Если срок следующей публикации
+                уже прошёл, она делается сразу.
+        """
+        now = time.time()
+        if last_fire is None:
+            due = channel.next_after(now) if channel.slots else now
+        else:
+            due = max(now, channel.next_after(last_fire))
+        deadline = time.monotonic() + due - now
+        self._deadlines[channel] = deadline
+        self._push(channel, deadline)
+
+    def wait(self):
+        """Дожидается ближайшей публикации и возвращает её чат"""
+        deadline, _, channel = heapq.heappop(self._heap)
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        observe('publish_schedule_lag_seconds', time.monotonic() - deadline, chat_id=channel.chat_id)
+        return channel
+
+    def retry(self, channel, delay):
+        """Повторяет публикацию через delay секунд, не сдвигая расписание"""
+        self._push(channel, time.monotonic() + delay)
+
+    def done(self, channel):
+        """Планирует следующую публикацию чата после успешной.
+
+        Returns:
+            float: Время, которое нужно сохранить как время последней
+                публикации (Unix time)
+        """
+        deadline = self._deadlines[channel]
+        now, monotonic_now = time.time(), time.monotonic()
+        if channel.slots:
+            last_fire = now
+            due = channel.next_after(max(now, now + deadline - monotonic_now))
+            next_deadline = monotonic_now + due - now
+        else:
+            last_fire = now + deadline - monotonic_now
+            next_deadline = deadline + channel.interval
+            if next_deadline <= monotonic_now:
+                skipped = (monotonic_now - next_deadline) // channel.interval + 1
+                next_deadline += skipped * channel.interval
+        self._deadlines[channel] = next_deadline
+        self._push(channel, next_deadline)
+        return last_fire
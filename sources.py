@@ -0,0 +1,91 @@
+from datetime import date
+from pathlib import Path
+from fetch_epic_images import get_latest_image_urls, iter_range_image_urls as iter_epic_range_urls
+from fetch_nasa_images import get_random_image_urls, iter_range_image_urls as iter_apod_range_urls
+from fetch_spacex_images import build_launch_query, get_launch_photos, iter_launch_groups
+
+
+class Source:
+    """Источник фотографий для fetch_all.
+
+    Источник только перечисляет, что скачать: группы (ссылки, папка, префикс).
+    Загрузкой занимается общий для всех источников пул, поэтому новый
+    источник достаточно унаследовать от Source и реализовать iter_groups.
+    """
+
+    name = 'source'
+
+    def __init__(self, folder, filename_prefix):
+        self.folder = Path(folder)
+        self.filename_prefix = filename_prefix
+
+    def iter_groups(self, cache=None):
+        """Перечисляет группы фото для download_groups
+
+        Args:
+            cache (HttpCache, optional): Кэш HTTP-ответов для запросов к API
+
+        Yields:
+            tuple: (ссылки на фото или пары (ссылка, метаданные), папка, префикс имени файла)
+        """
+        raise NotImplementedError
+
+
+class SpaceXSource(Source):
+    """Фото запуска SpaceX или всех запусков за период"""
+
+    name = 'spacex'
+
+    def __init__(self, folder='spacex_images', filename_prefix='spacex', launch_id=None, start_date=None, end_date=None):
+        super().__init__(folder, filename_prefix)
+        self.launch_id = launch_id
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def iter_groups(self, cache=None):
+        if self.start_date or self.end_date:
+            query = build_launch_query(self.start_date, self.end_date)
+            yield from iter_launch_groups(query, self.folder, self.filename_prefix)
+        else:
+            yield get_launch_photos(self.launch_id, cache=cache), self.folder, self.filename_prefix
+
+
+class ApodSource(Source):
+    """Снимки дня NASA APOD: случайные или за период"""
+
+    name = 'apod'
+
+    def __init__(self, api_key, folder='nasa_images', filename_prefix='nasa', count=30, start_date=None, end_date=None, quality='sd'):
+        super().__init__(folder, filename_prefix)
+        self.api_key = api_key
+        self.count = count
+        self.start_date = start_date
+        self.end_date = end_date
+        self.quality = quality
+
+    def iter_groups(self, cache=None):
+        if self.start_date:
+            image_urls = iter_apod_range_urls(self.api_key, self.start_date, self.end_date, self.quality, cache=cache)
+        else:
+            image_urls = get_random_image_urls(self.api_key, self.count, self.quality)
+        yield image_urls, self.folder, self.filename_prefix
+
+
+class EpicSource(Source):
+    """Снимки Земли NASA EPIC: последний день или за период"""
+
+    name = 'epic'
+
+    def __init__(self, api_key, folder='epic_images', filename_prefix='epic_photo', collection='natural', start_date=None, end_date=None):
+        super().__init__(folder, filename_prefix)
+        self.api_key = api_key
+        self.collection = collection
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def iter_groups(self, cache=None):
+        if self.start_date:
+            image_urls = iter_epic_range_urls(self.api_key, self.start_date, self.end_date or date.today(), self.collection, cache=cache)
+        else:
+            image_urls = get_latest_image_urls(self.api_key, self.collection, cache=cache)
+        yield image_urls, self.folder, self.filename_prefix
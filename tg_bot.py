@@ -1,29 +1,85 @@
 import argparse
 import os
+from contextlib import ExitStack
+import threading
 import warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='telegram.utils.request')
 from dotenv import load_dotenv
-from telegram import Bot
-from telegram.error import TelegramError
+from telegram import Bot, InputMediaPhoto
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from telegram.utils.request import Request
+from file_id_cache import FileIdCache
+from file_utils import file_sha256
+from metrics import inc, timed
 
+TELEGRAM_API_URL = 'https://api.telegram.org/bot'
+CON_POOL_SIZE = 8
+MAX_ALBUM_SIZE = 10
+MAX_PHOTO_SIZE = 10 * 1024 * 1024
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+# Ответы Telegram, означающие, что не подходит сам файл фото и повтор не поможет
+PHOTO_ERRORS = ('file too large', 'file is too big', 'request entity too large', 'photo_invalid_dimensions', 'image_process_failed', 'photo_save_file_invalid')
+# Ответы Telegram, означающие, что сохранённый file_id больше не годится
+FILE_ID_ERRORS = ('wrong file identifier', 'wrong remote file identifier', 'file reference expired', 'file_reference_expired')
 
-def handle_telegram_errors(e):
+_bots = {}
+_bots_lock = threading.Lock()
+
+
+class PhotoRejectedError(ValueError):
+    """Telegram не принимает файл фото: он слишком большой или повреждён"""
+
+
+def get_bot(token):
+    """Возвращает общий для процесса клиент Telegram для этого токена.
+
+    Клиент создаётся один раз и хранит пул HTTP-соединений, поэтому
+    повторные отправки не пересоздают бота и не открывают новое
+    TLS-соединение с api.telegram.org.
+
+    Args:
+        token (str): Токен Telegram-бота
+
+    Returns:
+        telegram.Bot: Клиент бота
+    """
+    with _bots_lock:
+        if token not in _bots:
+            _bots[token] = Bot(token=token, base_url=TELEGRAM_API_URL, request=Request(con_pool_size=CON_POOL_SIZE))
+        return _bots[token]
+
+
+def is_file_id_error(e):
+    """Проверяет, что Telegram отклонил запрос из-за устаревшего file_id"""
+    message = str(e).lower()
+    return isinstance(e, BadRequest) and any(marker in message for marker in FILE_ID_ERRORS)
+
+
+def handle_telegram_errors(e, chat_id=None):
     """Обрабатывает ошибки Telegram API и преобразует в понятные исключения.
 
     Args:
         e (TelegramError): Исходное исключение
+        chat_id (str, optional): ID чата, в который шла отправка
 
     Raises:
+        PhotoRejectedError: Если Telegram не принял сам файл (в том числе
+            ответ 413 «File too large») — повторять отправку бесполезно
+        RetryAfter, NetworkError: Временные ошибки пробрасываются как есть,
+            чтобы вызывающий код мог повторить отправку после паузы
         ValueError: Для ошибок связанных с чатом или форматом
         PermissionError: Для ошибок доступа
         RuntimeError: Для других ошибок API
     """
+    inc('telegram_errors_total', error=e.__class__.__name__)
+    if any(marker in str(e).lower() for marker in PHOTO_ERRORS):
+        raise PhotoRejectedError(f"Telegram не принял фото: {e}") from e
+    if isinstance(e, RetryAfter) or (isinstance(e, NetworkError) and not isinstance(e, BadRequest)):
+        raise e
     if "Chat not found" in str(e):
         raise ValueError(f"Чат {chat_id} не существует или бот не добавлен в него") from e
     elif "Forbidden" in str(e):
         raise PermissionError("Бот заблокирован в этом чате") from e
-    elif "Too Many Requests" in str(e):
-        raise RuntimeError("Превышен лимит запросов. Повторите через 10 минут") from e
     else:
         raise RuntimeError(f"Ошибка отправки: {e}") from e
 
@@ -40,15 +96,20 @@ def send_massage(token, chat_id, text):
         ValueError: Если не указан токен или chat_id
         TelegramError: При ошибках API Telegram
     """
-    bot = Bot(token=token)
+    bot = get_bot(token)
 
     try:
         bot.send_message(chat_id=chat_id, text=text)
     except TelegramError as e:
-        handle_telegram_errors(e)
+        handle_telegram_errors(e, chat_id)
+
 
+def get_bot_id(token):
+    """Возвращает числовой ID бота из токена (часть до двоеточия)"""
+    return token.split(':', 1)[0]
 
-def send_photo(token, chat_id, photo_path, caption=None):
+
+def send_photo(token, chat_id, photo_path, caption=None, file_ids=None):
     """Отправляет фото в Telegram чат/канал.
 
     Args:
@@ -56,21 +117,102 @@ def send_photo(token, chat_id, photo_path, caption=None):
         chat_id (str): ID чата/канала для отправки сообщений (можно указать в .env как TG_GROUP_CHAT_ID)
         photo_path (str): Путь к файлу изображения
         caption (str, optional): Подпись к фото
+        file_ids (FileIdCache, optional): Кэш file_id. Если фото уже
+            загружалось этим ботом, отправляется только его file_id.
+            Если Telegram его больше не принимает, файл загружается заново.
 
     Raises:
         ValueError: Если не указан токен или chat_id
         FileNotFoundError: Если файл не найден
         TelegramError: При ошибках API Telegram
     """
-    bot = Bot(token=token)
+    bot = get_bot(token)
+    bot_id = get_bot_id(token)
 
     try:
-        with open(photo_path, 'rb') as photo_file:
-            bot.send_photo(chat_id=chat_id, photo=photo_file, caption=caption)
+        sha256 = file_sha256(photo_path) if file_ids else None
+        file_id = file_ids.get(bot_id, sha256) if file_ids else None
+        if file_id:
+            try:
+                with timed('telegram_send_seconds', method='sendPhoto', upload='file_id'):
+                    bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption)
+                return
+            except BadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                file_ids.forget(bot_id, sha256)
+
+        with open(photo_path, 'rb') as photo_file, timed('telegram_send_seconds', method='sendPhoto', upload='file'):
+            message = bot.send_photo(chat_id=chat_id, photo=photo_file, caption=caption)
+        inc('telegram_upload_bytes_total', os.path.getsize(photo_path))
+        if file_ids:
+            file_ids.set(bot_id, sha256, message.photo[-1].file_id)
     except FileNotFoundError:
         raise FileNotFoundError(f"Файл '{photo_path}' не найден. Проверьте путь и права доступа") from None
     except TelegramError as e:
-        handle_photo_errors(e)
+        handle_telegram_errors(e, chat_id)
+
+
+def send_album(token, chat_id, photo_paths, caption=None, file_ids=None):
+    """Отправляет несколько фото одним альбомом (sendMediaGroup).
+
+    Args:
+        token (str): Токен Telegram-бота
+        chat_id (str): ID чата/канала для отправки
+        photo_paths (list): Пути к файлам изображений, от 2 до 10 штук
+        caption (str, optional): Подпись к альбому (показывается под первым фото)
+        file_ids (FileIdCache, optional): Кэш file_id. Уже загружавшиеся
+            фото отправляются по file_id, остальные загружаются.
+
+    Raises:
+        ValueError: Если фото меньше двух или больше MAX_ALBUM_SIZE
+        FileNotFoundError: Если файл не найден
+        TelegramError: При ошибках API Telegram
+    """
+    if not 2 <= len(photo_paths) <= MAX_ALBUM_SIZE:
+        raise ValueError(f"В альбоме должно быть от 2 до {MAX_ALBUM_SIZE} фото, передано {len(photo_paths)}")
+
+    bot = get_bot(token)
+    bot_id = get_bot_id(token)
+
+    def send(hashes, cached):
+        uploads = [photo_path for photo_path, sha256 in zip(photo_paths, hashes) if not cached.get(sha256)]
+        upload = 'file' if uploads else 'file_id'
+        with ExitStack() as stack, timed('telegram_send_seconds', method='sendMediaGroup', upload=upload):
+            media = [
+                InputMediaPhoto(
+                    media=cached.get(sha256) or stack.enter_context(open(photo_path, 'rb')),
+                    caption=caption if index == 0 else None
+                )
+                for index, (photo_path, sha256) in enumerate(zip(photo_paths, hashes))
+            ]
+            messages = bot.send_media_group(chat_id=chat_id, media=media)
+        inc('telegram_upload_bytes_total', sum(os.path.getsize(photo_path) for photo_path in uploads))
+        return messages
+
+    try:
+        hashes = [file_sha256(photo_path) if file_ids else None for photo_path in photo_paths]
+        cached = {}
+        if file_ids:
+            cached = {sha256: file_ids.get(bot_id, sha256) for sha256 in hashes}
+            cached = {sha256: file_id for sha256, file_id in cached.items() if file_id}
+
+        try:
+            messages = send(hashes, cached)
+        except BadRequest as e:
+            if not cached or not is_file_id_error(e):
+                raise
+            for sha256 in cached:
+                file_ids.forget(bot_id, sha256)
+            messages = send(hashes, {})
+
+        if file_ids:
+            for sha256, message in zip(hashes, messages):
+                file_ids.set(bot_id, sha256, message.photo[-1].file_id)
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Файл '{e.filename}' не найден. Проверьте путь и права доступа") from None
+    except TelegramError as e:
+        handle_telegram_errors(e, chat_id)
 
 
 def parse_arguments(default_token=None, default_chat_id=None):
@@ -88,6 +230,7 @@ def parse_arguments(default_token=None, default_chat_id=None):
     parser.add_argument('--chat_id', default=default_chat_id, metavar='', help='ID группы/чата (или укажите в TG_GROUP_CHAT_ID в .env)')
     parser.add_argument('--text', metavar='', help='Текст сообщения для отправки')
     parser.add_argument('--photo', metavar='', help='Путь к фото для отправки в группу')
+    parser.add_argument('--album', nargs='+', metavar='', help=f'Пути к фото для отправки одним альбомом (от 2 до {MAX_ALBUM_SIZE})')
     parser.add_argument('--caption', metavar='', help='Описание для фото')
     return parser.parse_args()
 
@@ -108,9 +251,14 @@ def main():
         send_massage(token=args.token, chat_id=args.chat_id, text=args.text)
         print('Сообщение отправлено!')
 
-    if args.photo:
-        send_photo(token=args.token, chat_id=args.chat_id, photo_path=args.photo, caption=args.caption)
-        print('Фото отправлено!')
+    with FileIdCache() as file_ids:
+        if args.photo:
+            send_photo(token=args.token, chat_id=args.chat_id, photo_path=args.photo, caption=args.caption, file_ids=file_ids)
+            print('Фото отправлено!')
+
+        if args.album:
+            send_album(token=args.token, chat_id=args.chat_id, photo_paths=args.album, caption=args.caption, file_ids=file_ids)
+            print('Альбом отправлен!')
 
 
 if __name__ == '__main__':